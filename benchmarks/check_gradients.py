@@ -0,0 +1,154 @@
+#
+# Finite-difference check of emulator gradients
+#
+# Fits GPEmulator (with NumPy and GPy predictions), NNEmulator and its
+# NumpyEmulator export on the logistic problem, and compares the gradients
+# returned by evaluateS1 with central finite differences
+# (utils.check_gradient) at random points inside the problem bounds. Also
+# checks that batched and single point evaluation agree, and that the
+# different code paths of the same emulator return the same gradients.
+#
+# Usage:
+#   python benchmarks/check_gradients.py [--points 5] [--tolerance 1e-4]
+#
+# Every point is checked with relative steps of 1e-4, 1e-5 and 1e-6 and
+# the smallest error is used: round-off in GP predictions dominates finite
+# differences at small steps, kinks of NN activations at large ones.
+#
+# Exits with a non-zero status if any check fails.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emupints  # noqa: E402
+from emupints import utils as emutils  # noqa: E402
+
+
+def emulators(problem, X, y, epochs):
+    """
+    Yields names and fitted emulators, one for every gradient code path.
+    """
+    import GPy
+    from sklearn.preprocessing import StandardScaler
+
+    log_likelihood = problem['log_likelihood']
+
+    kernels = [
+        ('rbf', GPy.kern.RBF(2, ARD=True)),
+        ('rbf*linear+bias', GPy.kern.RBF(2, ARD=True) * GPy.kern.Linear(2)
+         + GPy.kern.Bias(2)),
+        ('rbf+matern32', GPy.kern.RBF(2, ARD=True) + GPy.kern.Matern32(2)),
+    ]
+    for name, kernel in kernels:
+        for normalizer in (False, True):
+            gp = emupints.GPEmulator(
+                log_likelihood, X, y, input_scaler=StandardScaler(),
+                output_scaler=StandardScaler())
+            gp.set_parameters(kernel=kernel.copy())
+            gp.fit(messages=False, normalizer=normalizer)
+            label = 'gp ' + name + (' normalized' if normalizer else '')
+            yield label, gp
+
+    # predictions with GPy's predictive_gradients instead of NumPy
+    gpy = emupints.GPEmulator(
+        log_likelihood, X, y, input_scaler=StandardScaler(),
+        output_scaler=StandardScaler())
+    gpy.fit(messages=False)
+    gpy._predictor = None
+    yield 'gp gpy', gpy
+
+    nn = emupints.NNEmulator(
+        log_likelihood, X, y, input_scaler=StandardScaler(),
+        output_scaler=StandardScaler(), model_size='tiny')
+    nn.set_parameters()
+    nn.fit(epochs=epochs, verbose=0)
+    yield 'nn', nn
+    yield 'numpy', nn.to_numpy()
+
+
+def check(name, emulator, points, tolerance):
+    """
+    Returns a list of failure messages for one emulator.
+    """
+    failures = []
+
+    errors = [min(emutils.check_gradient(emulator, x, step)
+                  for step in (1e-4, 1e-5, 1e-6)) for x in points]
+    print('{:36s} max relative error {:.1e}'.format(name, max(errors)))
+    if max(errors) > tolerance:
+        failures.append('{}: gradient differs from finite differences '
+                        '({:.1e})'.format(name, max(errors)))
+
+    values, gradients = emulator.evaluateS1_batch(points)
+    singles = [emulator.evaluateS1(x) for x in points]
+    if not (np.allclose(values, [s[0] for s in singles]) and
+            np.allclose(gradients, [s[1] for s in singles]) and
+            np.allclose(values, emulator.evaluate_batch(points))):
+        failures.append(name + ': batched and single evaluations differ')
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare emulator gradients with finite differences')
+    parser.add_argument('--points', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--n-samples', type=int, default=150)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+
+    problem = emupints.Problems.load_problem(
+        emupints.Problems.LogisticModel, seed=args.seed)
+    X, y = emupints.Problems.generate_training_data(
+        problem, args.n_samples, seed=args.seed, n_workers=1)
+
+    # points away from the bounds, so finite differences stay inside
+    lower, upper = problem['bounds'].lower(), problem['bounds'].upper()
+    margin = 0.1 * (upper - lower)
+    points = emutils.sample_design(
+        lower + margin, upper - margin, args.points, seed=args.seed + 1)
+
+    failures = []
+    fitted = dict(emulators(problem, X, y, args.epochs))
+    for name, emulator in fitted.items():
+        failures.extend(check(name, emulator, points, args.tolerance))
+
+    # the NumPy export and TensorFlow must agree with the NumPy network
+    nn = fitted['nn']
+    reference = nn.evaluateS1_batch(points)[1]
+    exported = fitted['numpy'].evaluateS1_batch(points)[1]
+    network, nn._network = nn._network, None
+    try:
+        tape = nn.evaluateS1_batch(points)[1]
+    finally:
+        nn._network = network
+    for name, gradients in (('numpy export', exported),
+                            ('tensorflow', tape)):
+        error = np.max(np.abs(gradients - reference)) / \
+            np.max(np.abs(reference))
+        print('{:36s} relative difference to nn {:.1e}'.format(name, error))
+        if error > args.tolerance:
+            failures.append(name + ': gradient differs from NNEmulator')
+
+    for failure in failures:
+        print('FAILED ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#
+# Check that memoised predictions are discarded when an emulator changes
+#
+# Fits a GPEmulator on the logistic problem, wraps it in a CachedEmulator
+# and plots its surface, then changes the emulator (refitting with another
+# kernel, changing hyperparameters and calling compile_predictor(), adding
+# data) and checks after every change that both the values cached by the
+# CachedEmulator and the surfaces memoised by the plotting functions agree
+# with the emulator again.
+#
+# Usage:
+#   python benchmarks/check_invalidation.py
+#
+# Exits with a non-zero status if any check fails.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emupints  # noqa: E402
+from emupints import plot  # noqa: E402
+
+
+def changes(emulator, X, y):
+    """
+    Yields names of changes after making them to a fitted GPEmulator.
+    """
+    import GPy
+
+    emulator.set_parameters(kernel=GPy.kern.Linear(2) + GPy.kern.Bias(2))
+    emulator.fit(messages=False)
+    yield 'refit'
+
+    gp = emulator.get_gp(copy=False)
+    gp.kern.bias.variance = 10 * gp.kern.bias.variance
+    emulator.compile_predictor()
+    yield 'compile_predictor'
+
+    emulator.add_data(X[:5] * 1.01, y[:5])
+    yield 'add_data'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check invalidation of memoised emulator predictions')
+    parser.add_argument('--n-samples', type=int, default=100)
+    parser.add_argument('--n-splits', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    from sklearn.preprocessing import StandardScaler
+
+    problem = emupints.Problems.load_problem(
+        emupints.Problems.LogisticModel, seed=args.seed)
+    X, y = emupints.Problems.generate_training_data(
+        problem, args.n_samples, seed=args.seed, n_workers=1)
+    bounds = problem['bounds']
+
+    emulator = emupints.GPEmulator(
+        problem['log_likelihood'], X, y, input_scaler=StandardScaler(),
+        output_scaler=StandardScaler())
+    emulator.fit(messages=False)
+    cached = emupints.CachedEmulator(emulator)
+
+    def surface(f):
+        return plot._predict_panels(f, [[]], bounds, args.n_splits)[0]
+
+    failures = []
+    previous = surface(cached)
+    if surface(cached) is not previous:
+        failures.append('surface of unchanged emulator not memoised')
+    cached.evaluate_batch(X)
+
+    for name in changes(emulator, X, y):
+        current = surface(cached)
+        expected = surface(emulator)
+        surface_ok = current is not previous and np.allclose(
+            current, expected)
+        cache_ok = np.allclose(cached.evaluate_batch(X),
+                               emulator.evaluate_batch(X))
+        print('{:20s} plot memo {:5s} cache {}'.format(
+            name, 'ok' if surface_ok else 'stale',
+            'ok' if cache_ok else 'stale'))
+        if not surface_ok:
+            failures.append(name + ': memoised surface not discarded')
+        if not cache_ok:
+            failures.append(name + ': cached values not discarded')
+        previous = current
+
+    for failure in failures:
+        print('FAILED ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#
+# Check that problems loaded from an EvaluationCache match simulated ones
+#
+# Loads every Problems entry twice with the same seed and a fresh
+# EvaluationCache: the first call simulates the data and stores it, the
+# second restores it from the cache. Checks that both give the same data,
+# noise and log-likelihood, for single and multi-output problems.
+#
+# Usage:
+#   python benchmarks/check_problem_cache.py [--problems LogisticModel]
+#
+# Exits with a non-zero status if any check fails.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+import warnings
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emupints  # noqa: E402
+
+
+def problem_names():
+    """
+    Returns names of all problems defined in :class:`emupints.Problems`.
+    """
+    return [name for name, value in vars(emupints.Problems).items()
+            if isinstance(value, dict) and 'model' in value]
+
+
+def check(name, path, seed):
+    """
+    Returns a list of failure messages for one problem.
+    """
+    problem_dict = getattr(emupints.Problems, name)
+    cache = emupints.EvaluationCache(os.path.join(path, name))
+
+    simulated = emupints.Problems.load_problem(
+        problem_dict, seed=seed, cache=cache)
+    try:
+        restored = emupints.Problems.load_problem(
+            problem_dict, seed=seed, cache=cache)
+    except Exception:
+        return [name + ': loading from cache failed\n' +
+                traceback.format_exc()]
+
+    failures = []
+    if not np.array_equal(simulated['values'], restored['values']):
+        failures.append(name + ': restored values differ')
+    if not np.array_equal(simulated['noise_stds'], restored['noise_stds']):
+        failures.append(name + ': restored noise differs')
+    if np.ndim(simulated['noise_stds']) != np.ndim(restored['noise_stds']):
+        failures.append(name + ': restored noise has another shape')
+
+    x = problem_dict['parameters']
+    if simulated['log_likelihood'](x) != restored['log_likelihood'](x):
+        failures.append(name + ': restored log-likelihood differs')
+
+    print('{:24s} outputs {}  {}'.format(
+        name, problem_dict['n_outputs'], 'failed' if failures else 'ok'))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check problems restored from an EvaluationCache')
+    parser.add_argument('--problems', nargs='+', default=problem_names(),
+                        choices=problem_names())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+
+    path = tempfile.mkdtemp()
+    try:
+        failures = []
+        for name in args.problems:
+            failures.extend(check(name, path, args.seed))
+    finally:
+        shutil.rmtree(path)
+
+    for failure in failures:
+        print('FAILED ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#
+# Import-time benchmark for the emupints package root
+#
+# Importing emupints must not import GPy or TensorFlow, which are only
+# loaded on first use of the emulators built on them. Each measurement runs
+# in a fresh interpreter so nothing is cached in sys.modules.
+#
+# Usage:
+#   python benchmarks/import_time.py [--repeats 5] [--max-seconds 3]
+#
+# Exits with a non-zero status if a heavy backend is imported or the median
+# import time exceeds --max-seconds.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['GPy', 'tensorflow', 'keras', 'matplotlib']
+
+SCRIPT = """
+import json, sys, time
+start = time.time()
+import {module}
+elapsed = time.time() - start
+print(json.dumps({{
+    'time': elapsed,
+    'loaded': [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module, repeats):
+    """
+    Returns import times of ``module`` and heavy modules loaded with it.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+
+    times = []
+    loaded = set()
+    for _ in range(repeats):
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            env=env,
+        )
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded.update(result['loaded'])
+
+    return sorted(times), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure import time of the emupints package root')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for module in ['pints', 'emupints']:
+        times, loaded = measure(module, args.repeats)
+        median = times[len(times) // 2]
+        print('{:10s} median {:.3f}s  min {:.3f}s  heavy modules: {}'.format(
+            module, median, times[0], ', '.join(loaded) or 'none'))
+
+        if module == 'emupints':
+            if loaded:
+                print('Heavy modules imported by emupints: ' +
+                      ', '.join(loaded))
+                failed = True
+            if args.max_seconds is not None and median > args.max_seconds:
+                print('Import slower than {}s'.format(args.max_seconds))
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#
+# Peak memory benchmark for emulator training data
+#
+# Measures how much the peak resident set size (RSS) grows when an emulator
+# is created from a large training set, with the data copied (default),
+# adopted without copying (copy=False), stored as float32 or memory-mapped
+# from disk, and when the GPy model of a fitted GP is requested with and
+# without a deep copy. Each case runs in a fresh interpreter, after the
+# libraries and the data are loaded, so only the emulator is measured.
+#
+# Usage:
+#   python benchmarks/memory.py [--n-samples 1000000] [--n-parameters 5]
+#       [--n-gp 2000] [--output memory.json]
+#
+# Exits with a non-zero status if creating an emulator with copy=False
+# grows the peak RSS by more than 10% of the size of the training data.
+#
+# Peak RSS is read with the resource module, so this only runs on Unix.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+SCRIPT = """
+import json, resource, sys
+import numpy as np
+import pints
+import emupints
+import GPy
+
+def peak_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+case, path, n_gp = {case!r}, {path!r}, {n_gp!r}
+
+if case.startswith('get_gp'):
+    X = np.load(path + '_X.npy')[:n_gp]
+    y = np.load(path + '_y.npy')[:n_gp]
+    log_likelihood = pints.toy.GaussianLogPDF(
+        np.zeros(X.shape[1]), np.ones(X.shape[1]))
+    emulator = emupints.GPEmulator(log_likelihood, X, y, copy=False)
+    emulator.fit(optimize=False)
+    before = peak_mb()
+    gp = emulator.get_gp(copy=case == 'get_gp_copy')
+else:
+    mmap_mode = 'r' if case == 'mmap' else None
+    X = np.load(path + '_X.npy', mmap_mode=mmap_mode)
+    y = np.load(path + '_y.npy', mmap_mode=mmap_mode)
+    log_likelihood = pints.toy.GaussianLogPDF(
+        np.zeros(X.shape[1]), np.ones(X.shape[1]))
+    kwargs = {{
+        'copy': dict(),
+        'no_copy': dict(copy=False),
+        'float32': dict(dtype=np.float32),
+        'mmap': dict(copy=False),
+    }}[case]
+    before = peak_mb()
+    emulator = emupints.GPEmulator(log_likelihood, X, y, **kwargs)
+
+print(json.dumps({{
+    'case': case,
+    'peak_mb': peak_mb(),
+    'peak_increase_mb': peak_mb() - before,
+}}))
+"""
+
+CASES = ['copy', 'no_copy', 'float32', 'mmap', 'get_gp_copy', 'get_gp_view']
+
+
+def measure(case, path, n_gp):
+    """
+    Runs a single case in a fresh interpreter, returns its result.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         SCRIPT.format(case=case, path=path, n_gp=n_gp)],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure peak memory of emulator training data')
+    parser.add_argument('--n-samples', type=int, default=1000000)
+    parser.add_argument('--n-parameters', type=int, default=5)
+    parser.add_argument('--n-gp', type=int, default=2000)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(args.n_samples, args.n_parameters))
+    y = np.sum(np.sin(3 * X), axis=1)
+    data_mb = (X.nbytes + y.nbytes) / 1024. ** 2
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'training')
+    np.save(path + '_X.npy', X)
+    np.save(path + '_y.npy', y)
+    del X, y
+
+    print('Training data: {:.1f} MB'.format(data_mb))
+    results = []
+    try:
+        for case in CASES:
+            result = measure(case, path, args.n_gp)
+            results.append(result)
+            print('{:12s} peak RSS {:8.1f} MB, +{:8.1f} MB'.format(
+                case, result['peak_mb'], result['peak_increase_mb']))
+    finally:
+        for name in ('_X.npy', '_y.npy'):
+            os.remove(path + name)
+        os.rmdir(directory)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'settings': vars(args),
+                'data_mb': data_mb,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    no_copy = [r for r in results if r['case'] == 'no_copy'][0]
+    failed = no_copy['peak_increase_mb'] > 0.1 * data_mb
+    if failed:
+        print('Emulator with copy=False copied its training data')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#
+# Benchmark suite for emulators of every Problems entry
+#
+# For each problem and training set size this measures
+#   - generation of the training set (simulations of the true likelihood),
+#   - fitting of GPEmulator and NNEmulator,
+#   - latency of single point and batched predictions,
+#   - MCMC throughput with the emulated and with the true likelihood.
+# Results are written as JSON, one row per measurement, together with the
+# versions used, so scaling curves can be compared across versions.
+#
+# Usage:
+#   python benchmarks/suite.py [--problems LogisticModel SIRModel]
+#       [--sizes 100 200 400] [--backends gp nn] [--output results.json]
+#
+# By default results are written to
+#   benchmarks/results/<emupints version>-<date>.json
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pints  # noqa: E402
+import emupints  # noqa: E402
+
+
+def problem_names():
+    """
+    Returns names of all problems defined in :class:`emupints.Problems`.
+    """
+    return [name for name, value in vars(emupints.Problems).items()
+            if isinstance(value, dict) and 'model' in value]
+
+
+def timed(f, repeats=1):
+    """
+    Calls f ``repeats`` times, returns the median time in seconds and the
+    result of the last call.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def latency(f, x, min_seconds=0.2):
+    """
+    Returns the median time of a call f(x), measured in rounds taking
+    about ``min_seconds``.
+    """
+    f(x)
+    n = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(n):
+            f(x)
+        elapsed = time.perf_counter() - start
+        if elapsed > min_seconds / 5 or n > 1e6:
+            break
+        n *= 10
+
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(n):
+            f(x)
+        rounds.append((time.perf_counter() - start) / n)
+    return float(np.median(rounds))
+
+
+def mcmc_throughput(log_likelihood, problem, iterations, seed):
+    """
+    Returns iterations per second of an adaptive covariance MCMC chain
+    started at the true parameters.
+    """
+    log_posterior = pints.LogPosterior(log_likelihood, problem['log_prior'])
+    mcmc = pints.MCMCController(
+        log_posterior, 1, [problem['parameters']],
+        method=pints.HaarioBardenetACMC)
+    mcmc.set_max_iterations(iterations)
+    mcmc.set_log_to_screen(False)
+
+    np.random.seed(seed)
+    seconds, _ = timed(mcmc.run)
+    return iterations / seconds
+
+
+def fit_emulator(backend, problem, X, y, epochs):
+    """
+    Returns a fitted emulator of the given backend, "gp" or "nn".
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    kwargs = dict(input_scaler=StandardScaler(),
+                  output_scaler=StandardScaler())
+    if backend == 'gp':
+        emulator = emupints.GPEmulator(
+            problem['log_likelihood'], X, y, **kwargs)
+        emulator.fit(messages=False)
+    else:
+        emulator = emupints.NNEmulator(
+            problem['log_likelihood'], X, y, **kwargs)
+        emulator.set_parameters()
+        emulator.fit(epochs=epochs, verbose=0)
+    return emulator
+
+
+def benchmark_problem(name, args):
+    """
+    Runs all benchmarks of a single problem, returns list of result rows.
+    """
+    rows = []
+
+    def add(benchmark, value, unit, **keys):
+        row = {'problem': name, 'benchmark': benchmark,
+               'value': value, 'unit': unit}
+        row.update(keys)
+        rows.append(row)
+        print('{:22s} {:28s} {:>12.6g} {:8s} {}'.format(
+            name, benchmark, value, unit,
+            ' '.join('{}={}'.format(k, v) for k, v in sorted(keys.items()))))
+
+    problem = emupints.Problems.load_problem(
+        getattr(emupints.Problems, name), seed=args.seed)
+    true_likelihood = problem['log_likelihood']
+    bounds = problem['bounds']
+
+    X_test = emupints.utils.sample_design(
+        bounds.lower(), bounds.upper(), args.batch_size, design='uniform',
+        seed=args.seed + 1)
+    x = problem['parameters']
+
+    add('likelihood_latency', latency(true_likelihood, x), 's')
+    add('mcmc_throughput', mcmc_throughput(
+        true_likelihood, problem, args.mcmc_iterations, args.seed),
+        'iterations/s', likelihood='true')
+
+    for n_samples in args.sizes:
+        seconds, (X, y) = timed(lambda: emupints.Problems.
+                                generate_training_data(
+                                    problem, n_samples, seed=args.seed,
+                                    n_workers=args.n_workers))
+        add('training_data', seconds, 's', n_samples=n_samples)
+
+        for backend in args.backends:
+            keys = {'n_samples': n_samples, 'backend': backend}
+            seconds, emulator = timed(lambda: fit_emulator(
+                backend, problem, X, y, args.epochs))
+            add('fit', seconds, 's', **keys)
+
+            add('call_latency', latency(emulator, x), 's', **keys)
+            add('batch_latency', latency(emulator.evaluate_batch, X_test),
+                's', batch_size=args.batch_size, **keys)
+
+            true_y = np.array([true_likelihood(p) for p in X_test])
+            error = np.abs(emulator.evaluate_batch(X_test) - true_y)
+            add('median_abs_error', float(np.median(error)), '', **keys)
+
+            add('mcmc_throughput', mcmc_throughput(
+                emulator, problem, args.mcmc_iterations, args.seed),
+                'iterations/s', likelihood='emulator', **keys)
+
+    return rows
+
+
+def environment():
+    """
+    Returns versions and hardware the benchmarks were run with.
+    """
+    info = {
+        'emupints': emupints.VERSION,
+        'pints': pints.__version__,
+        'numpy': np.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'date': datetime.datetime.now().isoformat(),
+    }
+    for module in ['GPy', 'tensorflow']:
+        if module in sys.modules:
+            info[module] = getattr(sys.modules[module], '__version__', None)
+    try:
+        info['commit'] = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark emulators on all emupints problems')
+    parser.add_argument('--problems', nargs='+', default=problem_names(),
+                        choices=problem_names())
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[100, 200, 400])
+    parser.add_argument('--backends', nargs='+', default=['gp', 'nn'],
+                        choices=['gp', 'nn'])
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--mcmc-iterations', type=int, default=2000)
+    parser.add_argument('--n-workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        output = os.path.join(
+            ROOT, 'benchmarks', 'results', '{}-{}.json'.format(
+                emupints.VERSION,
+                datetime.datetime.now().strftime('%Y%m%d-%H%M%S')))
+    directory = os.path.dirname(os.path.abspath(output))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    rows = []
+    for name in args.problems:
+        rows.extend(benchmark_problem(name, args))
+
+    settings = dict(vars(args))
+    settings.pop('output')
+    # after running, so versions of the backends used are known
+    with open(output, 'w') as f:
+        json.dump({
+            'environment': environment(),
+            'settings': settings,
+            'results': rows,
+        }, f, indent=2, sort_keys=True)
+    print('Results written to ' + output)
+
+
+if __name__ == '__main__':
+    main()
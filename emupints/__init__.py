@@ -29,13 +29,59 @@ def version(formatted=False):
 #
 # Different types of emulators
 #
+# Emulators backed by GPy or TensorFlow are only imported on first use, as
+# importing those libraries takes seconds and hundreds of MB of memory.
+#
 from ._emulator import Emulator
-from ._gp_emulator import GPEmulator
-from ._nn_emulator import NNEmulator
+from ._numpy_emulator import NumpyEmulator
 from ._wrapper import EmulatorWrapper
 from ._problems import Problems
+from ._cache import EvaluationCache, problem_key
+from ._delayed_acceptance import DelayedAcceptanceMCMC
+from ._batched_mcmc import BatchedMCMCController
+from ._evaluation_server import EvaluationServer
+from ._cached_emulator import CachedEmulator
+from ._profiling import Profiler
+from ._trajectory_emulator import TrajectoryEmulator, TrajectoryLogLikelihood
+
+_LAZY_ATTRIBUTES = {
+    'GPEmulator': '._gp_emulator',
+    'LocalGPEmulator': '._local_gp_emulator',
+    'NNEmulator': '._nn_emulator',
+    'ActiveLearner': '._active_learning',
+}
+
+_LAZY_MODULES = ('kernels', 'metrics', 'models', 'plot', 'utils')
+
+__all__ = ["Emulator", "GPEmulator", "LocalGPEmulator", 'EmulatorWrapper',
+           'NNEmulator', "Problems", "EvaluationCache", "problem_key",
+           "ActiveLearner", "NumpyEmulator", "DelayedAcceptanceMCMC",
+           "BatchedMCMCController", "EvaluationServer", "TrajectoryEmulator",
+           "TrajectoryLogLikelihood", "CachedEmulator",
+           "Profiler"]
+
+
+def __getattr__(name):
+    """
+    Imports heavy emulators and submodules when they are first accessed.
+    """
+    import importlib
+
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+    elif name in _LAZY_MODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError(
+            "module '" + __name__ + "' has no attribute '" + name + "'")
+
+    globals()[name] = value
+    return value
+
 
-__all__ = ["Emulator", "GPEmulator", 'EmulatorWrapper', 'NNEmulator', "Problems"]
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_LAZY_MODULES))
 
 
 #
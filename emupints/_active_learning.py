@@ -0,0 +1,243 @@
+#
+# Adaptive design: add training points where the emulator is least certain
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._gp_emulator import GPEmulator
+from . import metrics
+from . import utils as emutils
+import numpy as np
+import pints
+import time
+
+from scipy.stats import norm
+
+
+class ActiveLearner(object):
+    """
+    Sequential design for emulators of expensive likelihoods.
+
+    Every iteration the emulator is fitted to the current training data and
+    MCMC chains are run on the emulated posterior. Points visited by the
+    chains are scored by an acquisition function and the true likelihood is
+    evaluated for a batch of the best ones, which are then added to the
+    training data. Simulator calls are therefore spent where the posterior
+    mass is and where the emulator is uncertain.
+
+    For :class:`GPEmulator` the hyperparameters found in one iteration are
+    the starting point of the optimisation in the next one.
+
+    Arguments:
+
+    ``log_likelihood``
+        A :class:`LogPDF`, the (expensive) likelihood being emulated.
+    ``log_prior``
+        A :class:`LogPrior` used to form the posterior sampled by MCMC.
+    ``X``
+        N by n_parameters matrix, initial training inputs.
+    ``y``
+        N values of log_likelihood at X.
+    ``emulator_class``
+        (Optional) Emulator class, must provide predict() returning mean and
+        variance, e.g. :class:`GPEmulator`.
+    ``emulator_kwargs``
+        (Optional) Dictionary of additional arguments for the emulator,
+        e.g. input and output scalers.
+    """
+
+    def __init__(self, log_likelihood, log_prior, X, y,
+                 emulator_class=GPEmulator, emulator_kwargs=None):
+        if not isinstance(log_likelihood, pints.LogPDF):
+            raise ValueError("Given pdf must extend LogPDF")
+
+        self._log_likelihood = log_likelihood
+        self._log_prior = log_prior
+        self._X = np.array(X, dtype=float)
+        self._y = np.array(y, dtype=float).reshape(len(self._X))
+
+        self._emulator_class = emulator_class
+        self._emulator_kwargs = emulator_kwargs or {}
+
+        self._acquisition = "variance"
+        self._batch_size = 10
+        self._n_chains = 3
+        self._n_mcmc_iterations = 2000
+        self._n_workers = 1
+
+        self._history = []
+
+    def set_parameters(
+            self,
+            acquisition=None,
+            batch_size=None,
+            n_chains=None,
+            n_mcmc_iterations=None,
+            n_workers=None):
+        """
+        Sets parameters of the design loop.
+
+        ``acquisition``
+            "variance" picks candidates with the largest predictive variance,
+            "ei" picks candidates with the largest expected improvement over
+            the best log-likelihood seen so far.
+        ``batch_size``
+            Number of true likelihood evaluations per iteration.
+        ``n_chains``
+            Number of MCMC chains used to generate candidates.
+        ``n_mcmc_iterations``
+            Length of every chain, first half is discarded as warm-up.
+        ``n_workers``
+            Number of processes evaluating the true likelihood.
+        """
+        if acquisition:
+            if acquisition not in ("variance", "ei"):
+                raise ValueError("Unknown acquisition: " + acquisition)
+            self._acquisition = acquisition
+
+        if batch_size:
+            self._batch_size = batch_size
+
+        if n_chains:
+            self._n_chains = n_chains
+
+        if n_mcmc_iterations:
+            self._n_mcmc_iterations = n_mcmc_iterations
+
+        if n_workers:
+            self._n_workers = n_workers
+
+    def run(self, n_iterations=10, target_mape=None, max_evaluations=None,
+            messages=False):
+        """
+        Runs the design loop and returns the final fitted emulator.
+
+        Stops after ``n_iterations``, once ``max_evaluations`` true
+        likelihood evaluations were made, or when the mean absolute
+        percentage error of the emulator on a newly acquired batch (measured
+        before the batch is added) drops below ``target_mape``. As batches
+        are drawn along the chains where the emulator is least certain, this
+        is a pessimistic estimate of :func:`metrics.chain_mape`.
+        """
+        n_evaluations = 0
+        emu = self._fit(None)
+        for iteration in range(n_iterations):
+            if max_evaluations is not None and \
+                    n_evaluations >= max_evaluations:
+                break
+
+            batch_size = self._batch_size
+            if max_evaluations is not None:
+                batch_size = min(batch_size, max_evaluations - n_evaluations)
+
+            start = time.time()
+            candidates = self._candidates(emu)
+            X_new = self._select(emu, candidates, batch_size)
+            y_new = emutils.evaluate_parallel(
+                self._log_likelihood, X_new, n_workers=self._n_workers)
+            n_evaluations += len(X_new)
+
+            batch_mape = metrics.mape(y_new, emu.evaluate_batch(X_new))
+
+            self._X = np.vstack([self._X, X_new])
+            self._y = np.concatenate([self._y, y_new])
+            emu = self._fit(emu)
+
+            self._history.append({
+                "iteration": iteration,
+                "n_evaluations": n_evaluations,
+                "n_training_points": len(self._X),
+                "batch_mape": batch_mape,
+                "time": time.time() - start,
+            })
+            if messages:
+                print("Iteration {}: {} points, batch mape {:.5f}".format(
+                    iteration, len(self._X), batch_mape))
+
+            if target_mape is not None and batch_mape < target_mape:
+                break
+
+        self._emulator = emu
+        return emu
+
+    def _fit(self, previous):
+        """
+        Fits a new emulator on current data, starting the hyperparameter
+        optimisation from the values of the previous emulator.
+        """
+        emu = self._emulator_class(
+            self._log_likelihood, self._X, self._y, **self._emulator_kwargs)
+        if previous is None or not isinstance(previous, GPEmulator):
+            emu.fit(messages=False)
+            return emu
+
+        emu.set_parameters(kernel=previous.get_trained_kern().copy())
+        emu.fit(optimize=False)
+        emu._gp.likelihood[:] = previous._gp.likelihood.param_array
+        emu.optimize(messages=False)
+        return emu
+
+    def _candidates(self, emu):
+        """
+        Returns unique points visited by MCMC chains on emulated posterior.
+        """
+        log_posterior = pints.LogPosterior(
+            emu, self._log_prior)
+
+        # start chains from the best points found so far
+        best = np.argsort(self._y)[::-1][:self._n_chains]
+        x0 = [self._X[i] for i in best]
+        while len(x0) < self._n_chains:
+            x0.append(self._log_prior.sample(1)[0])
+
+        mcmc = pints.MCMCController(
+            log_posterior, self._n_chains, x0,
+            method=pints.HaarioBardenetACMC)
+        mcmc.set_max_iterations(self._n_mcmc_iterations)
+        mcmc.set_log_to_screen(False)
+        chains = mcmc.run()
+
+        warm_up = self._n_mcmc_iterations // 2
+        candidates = chains[:, warm_up:, :].reshape(
+            (-1, chains.shape[2]))
+        return np.unique(candidates, axis=0)
+
+    def _select(self, emu, candidates, batch_size):
+        """
+        Returns batch_size candidates with the highest acquisition score.
+        """
+        mean, var = emu.predict(candidates)
+        mean, var = mean.flatten(), np.clip(var.flatten(), 0, np.inf)
+
+        if self._acquisition == "variance":
+            score = var
+        else:
+            # expected improvement over the best (scaled) training output
+            best = np.max(emu._y)
+            std = np.sqrt(var)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = np.where(std > 0, (mean - best) / std, 0)
+            score = (mean - best) * norm.cdf(z) + std * norm.pdf(z)
+
+        return candidates[np.argsort(score)[::-1][:batch_size]]
+
+    def emulator(self):
+        """
+        Returns the emulator fitted in the last iteration.
+        """
+        assert hasattr(self, "_emulator"), "Must first run the design loop"
+
+        return self._emulator
+
+    def history(self):
+        """
+        Returns a list with a dictionary of statistics for every iteration.
+        """
+        return self._history
+
+    def training_data(self):
+        """
+        Returns current training inputs and log-likelihoods.
+        """
+        return self._X, self._y
@@ -0,0 +1,194 @@
+#
+# MCMC controller evaluating the proposals of all chains in one batch
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from . import utils as emutils
+import numpy as np
+import pints
+
+
+class BatchedMCMCController(object):
+    """
+    Runs several PINTS MCMC chains on the posterior of an emulated
+    likelihood. Every iteration the proposals of all chains are collected
+    (through the samplers' ask/tell interface) and evaluated with a single
+    call of the emulator's ``evaluate_batch``, instead of one emulator call
+    per chain as with :class:`pints.MCMCController`. Gradient based samplers
+    are evaluated with ``evaluateS1_batch``.
+
+    Both single chain (e.g. :class:`pints.HaarioBardenetACMC`) and multi
+    chain (e.g. :class:`pints.DreamMCMC`) methods are supported.
+
+    Arguments:
+
+    ``log_likelihood``
+        Emulator, :class:`EvaluationServer`, or any :class:`LogPDF`;
+        objects without ``evaluate_batch`` are evaluated point by point.
+    ``log_prior``
+        A :class:`LogPrior`.
+    ``x0``
+        List of starting points, one for each chain.
+    ``sigma0``
+        (Optional) Initial covariance or standard deviations of the
+        proposal, passed to the samplers.
+    ``method``
+        (Optional) PINTS sampler class, :class:`pints.HaarioBardenetACMC`
+        by default.
+    """
+
+    def __init__(self, log_likelihood, log_prior, x0, sigma0=None,
+                 method=None):
+        self._log_likelihood = log_likelihood
+        self._log_prior = log_prior
+        self._n_parameters = log_likelihood.n_parameters()
+
+        if log_prior.n_parameters() != self._n_parameters:
+            raise ValueError("Prior and likelihood dimensions don't match")
+
+        x0 = np.array(x0, dtype=float)
+        if x0.ndim != 2 or x0.shape[1] != self._n_parameters:
+            raise ValueError("x0 should have shape (n_chains, n_parameters)")
+        self._n_chains = len(x0)
+
+        if method is None:
+            method = pints.HaarioBardenetACMC
+
+        self._single_chain = issubclass(method, pints.SingleChainMCMC)
+        if self._single_chain:
+            self._samplers = [method(x, sigma0) for x in x0]
+        else:
+            self._samplers = [method(self._n_chains, x0, sigma0)]
+
+        self._needs_sensitivities = self._samplers[0].needs_sensitivities()
+
+        self._max_iterations = 10000
+        self._initial_phase_iterations = None
+        if self._samplers[0].needs_initial_phase():
+            self._initial_phase_iterations = 200
+
+        self._n_evaluations = 0
+        self._n_batches = 0
+
+    def set_max_iterations(self, iterations=10000):
+        """
+        Sets the number of samples in every chain.
+        """
+        if iterations < 1:
+            raise ValueError("Number of iterations must be positive")
+        self._max_iterations = int(iterations)
+
+    def set_initial_phase_iterations(self, iterations=200):
+        """
+        Sets the number of iterations in the initial phase of samplers that
+        need one, e.g. adaptive covariance methods.
+        """
+        if not self._samplers[0].needs_initial_phase():
+            raise NotImplementedError("Method doesn't need an initial phase")
+        self._initial_phase_iterations = int(iterations)
+
+    def samplers(self):
+        """
+        Returns the PINTS samplers, e.g. to set their hyperparameters.
+        """
+        return self._samplers
+
+    def run(self):
+        """
+        Runs all chains and returns them as an array of shape
+        (n_chains, n_iterations, n_parameters).
+        """
+        n = self._max_iterations
+        chains = np.zeros((self._n_chains, n, self._n_parameters))
+        n_samples = np.zeros(self._n_chains, dtype=int)
+
+        initial_phase = self._initial_phase_iterations is not None
+        if initial_phase:
+            for sampler in self._samplers:
+                sampler.set_initial_phase(True)
+
+        self._n_evaluations = 0
+        self._n_batches = 0
+        iteration = 0
+        while np.any(n_samples < n):
+            if initial_phase and iteration >= self._initial_phase_iterations:
+                for sampler in self._samplers:
+                    sampler.set_initial_phase(False)
+                initial_phase = False
+
+            if self._single_chain:
+                # samplers that finished early stop asking for points
+                active = np.where(n_samples < n)[0]
+                xs = [self._samplers[i].ask() for i in active]
+                replies = zip(active, self._evaluate(xs))
+                replies = [(i, self._samplers[i].tell(fx))
+                           for i, fx in replies]
+            else:
+                xs = self._samplers[0].ask()
+                reply = self._samplers[0].tell(self._evaluate(xs))
+                replies = []
+                if reply is not None:
+                    replies = [(i, (y, None, None))
+                               for i, y in enumerate(reply[0])]
+
+            for i, reply in replies:
+                if reply is not None:
+                    chains[i, n_samples[i]] = reply[0]
+                    n_samples[i] += 1
+
+            # like pints, an iteration ends once every chain has a new sample
+            if np.min(n_samples) > iteration:
+                iteration += 1
+
+        return chains
+
+    def _evaluate(self, xs):
+        """
+        Evaluates the log-posterior for all proposals with a single batched
+        call of the likelihood, skipping points outside the prior support.
+        """
+        X = np.asarray(xs, dtype=float).reshape((-1, self._n_parameters))
+        self._n_evaluations += len(X)
+        self._n_batches += 1
+
+        if self._needs_sensitivities:
+            priors = [self._log_prior.evaluateS1(x) for x in X]
+            values = np.array([p[0] for p in priors])
+            gradients = np.array([p[1] for p in priors])
+        else:
+            values = np.array([self._log_prior(x) for x in X])
+
+        inside = np.isfinite(values)
+        if np.any(inside):
+            if self._needs_sensitivities:
+                y, dy = _evaluateS1_batch(self._log_likelihood, X[inside])
+                gradients[inside] += dy
+            else:
+                y = emutils.evaluate_batch(self._log_likelihood, X[inside])
+            values[inside] += y
+
+        if self._needs_sensitivities:
+            return [(float(v), g) for v, g in zip(values, gradients)]
+        return [float(v) for v in values]
+
+    def n_evaluations(self):
+        """
+        Returns the number of points evaluated in the last run.
+        """
+        return self._n_evaluations
+
+    def n_batches(self):
+        """
+        Returns the number of batched likelihood calls in the last run.
+        """
+        return self._n_batches
+
+
+def _evaluateS1_batch(f, X):
+    if hasattr(f, "evaluateS1_batch"):
+        return f.evaluateS1_batch(X)
+    results = [f.evaluateS1(x) for x in X]
+    return (np.array([r[0] for r in results], dtype=float),
+            np.array([r[1] for r in results], dtype=float))
@@ -0,0 +1,221 @@
+#
+# On-disk cache of simulated likelihood evaluations
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import hashlib
+import uuid
+import os
+
+
+class EvaluationCache(object):
+    """
+    Content-addressed store of likelihood evaluations kept on disk, so that
+    simulations done for a problem are never repeated across runs.
+
+    Evaluations are grouped by a key identifying the problem (see
+    :func:`problem_key`) and looked up by the exact bytes of each parameter
+    vector. Every group is a directory of ``.npy`` chunks that are memory
+    mapped on read; new points are added as new chunks, so existing files
+    are never rewritten.
+
+    Arguments:
+
+    ``path``
+        Directory holding the cache, created if it doesn't exist.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # maps problem key to dictionary of parameter bytes -> (chunk, row)
+        self._index = {}
+        self._chunks = {}
+
+    def lookup(self, key, X):
+        """
+        Returns cached values for each row of X as an array with NaN for
+        points that were not evaluated yet, and a boolean mask of found rows.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        index = self._load_index(key)
+        chunks = self._chunks[key]
+
+        y = np.full(len(X), np.nan)
+        found = np.zeros(len(X), dtype=bool)
+        for i, x in enumerate(X):
+            location = index.get(x.tobytes())
+            if location is not None:
+                chunk, row = location
+                y[i] = chunks[chunk][1][row]
+                found[i] = True
+
+        return y, found
+
+    def append(self, key, X, y):
+        """
+        Adds evaluations ``y`` of parameter vectors ``X`` to the cache.
+        Points already in the cache are skipped.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.ascontiguousarray(y, dtype=np.float64).reshape(len(X))
+        index = self._load_index(key)
+
+        new = []
+        seen = set()
+        for i, x in enumerate(X):
+            b = x.tobytes()
+            if b not in index and b not in seen:
+                seen.add(b)
+                new.append(i)
+        if not new:
+            return
+
+        X, y = X[new], y[new]
+        directory = self._directory(key)
+        chunk = len(self._chunks[key])
+        # unique names, so processes appending at the same time (or with
+        # an outdated list of chunks) never overwrite each other's chunks
+        name = "{:06d}_{}".format(chunk, uuid.uuid4().hex)
+        _save_atomic(os.path.join(directory, "y_" + name + ".npy"), y)
+        # inputs written last mark the chunk as complete
+        _save_atomic(os.path.join(directory, "X_" + name + ".npy"), X)
+
+        self._chunks[key].append((X, y))
+        for row, x in enumerate(X):
+            index[x.tobytes()] = (chunk, row)
+
+    def load(self, key):
+        """
+        Returns all cached inputs and values for a key.
+        """
+        self._load_index(key)
+        chunks = self._chunks[key]
+        if not chunks:
+            return np.zeros((0, 0)), np.zeros(0)
+        if len(chunks) == 1:
+            return chunks[0]
+        return (np.concatenate([X for (X, _) in chunks]),
+                np.concatenate([y for (_, y) in chunks]))
+
+    def n_evaluations(self, key):
+        """
+        Returns number of evaluations cached for a key.
+        """
+        return len(self._load_index(key))
+
+    def save_arrays(self, key, name, **arrays):
+        """
+        Stores named arrays under a key, e.g. simulated data of a problem.
+        """
+        path = os.path.join(self._directory(key), name + ".npz")
+        _write_atomic(path, lambda f: np.savez(f, **arrays))
+
+    def load_arrays(self, key, name):
+        """
+        Returns dictionary of arrays stored by save_arrays() or None.
+        """
+        path = os.path.join(self._directory(key), name + ".npz")
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            return dict(data)
+
+    def _directory(self, key):
+        directory = os.path.join(self._path, key)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    def _load_index(self, key):
+        if key in self._index:
+            return self._index[key]
+
+        directory = self._directory(key)
+        files = set(os.listdir(directory))
+        # skips files left by interrupted writes: temporary files, and
+        # inputs without values (written by older versions)
+        names = sorted(f[2:-4] for f in files
+                       if f.startswith("X_") and f.endswith(".npy") and
+                       ".tmp" not in f and "y_" + f[2:] in files)
+        index = {}
+        chunks = []
+        for chunk, name in enumerate(names):
+            X = np.load(os.path.join(directory, "X_" + name + ".npy"),
+                        mmap_mode="r")
+            y = np.load(os.path.join(directory, "y_" + name + ".npy"),
+                        mmap_mode="r")
+            chunks.append((X, y))
+            for row in range(len(X)):
+                index[X[row].tobytes()] = (chunk, row)
+
+        self._index[key] = index
+        self._chunks[key] = chunks
+        return index
+
+
+def problem_key(problem, seed=None):
+    """
+    Returns a hash identifying a problem dictionary (a class attribute of
+    :class:`Problems` or an instance from load_problem) and the seed of
+    the noise added to its simulated data.
+    """
+    h = hashlib.sha1()
+    for name in sorted(problem):
+        if name in _DERIVED_KEYS:
+            continue
+        h.update(name.encode("utf-8"))
+        h.update(_canonical(problem[name]))
+
+    h.update(b"seed")
+    h.update(repr(seed).encode("utf-8"))
+    return h.hexdigest()
+
+
+# entries of loaded problems that are fully determined by other entries
+_DERIVED_KEYS = (
+    "problem", "bounds", "log_likelihood", "log_prior", "log_posterior")
+
+
+def _canonical(value):
+    """
+    Returns bytes representing a value of a problem dictionary.
+    """
+    if isinstance(value, type):
+        return (value.__module__ + "." + value.__name__).encode("utf-8")
+    if isinstance(value, (np.ndarray, list, tuple)):
+        try:
+            return np.ascontiguousarray(value, dtype=np.float64).tobytes()
+        except (TypeError, ValueError):
+            return repr(value).encode("utf-8")
+    if value is None or isinstance(value, (int, float, str)):
+        return repr(value).encode("utf-8")
+
+    # instantiated model, identified by its class
+    return _canonical(type(value))
+
+
+def _save_atomic(path, array):
+    _write_atomic(path, lambda f: np.save(f, array))
+
+
+def _write_atomic(path, write):
+    """
+    Calls ``write`` with a temporary file that replaces ``path`` once it is
+    complete. Temporary names end in ``.tmp`` (NumPy doesn't add a suffix
+    to file objects), so they never match the names of chunks.
+    """
+    tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
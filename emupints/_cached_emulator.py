@@ -0,0 +1,174 @@
+#
+# In-memory LRU cache of emulator predictions
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import _LogLikelihood, _batch_array
+from . import utils as emutils
+import collections
+import numpy as np
+
+
+class CachedEmulator(_LogLikelihood):
+    """
+    *Extends:* :class:`LogLikelihood` (:class:`LogPDF` for older pints)
+
+    Memoises the predictions of an emulator, so that points evaluated again,
+    e.g. the current state of an MCMC chain after a rejected proposal, cost a
+    dictionary lookup instead of a prediction.
+
+    Points are looked up by the exact bytes of the parameter vector, or, if
+    a ``resolution`` is given, by the vector rounded to a multiple of it, so
+    nearly identical points share a prediction. At most ``max_size`` values
+    are kept, the least recently used are discarded first.
+
+    Arguments:
+
+    ``emulator``
+        Emulator, :class:`EmulatorWrapper` or any :class:`LogPDF`.
+    ``max_size``
+        (Optional) Maximum number of cached values.
+    ``resolution``
+        (Optional) Grid spacing parameter vectors are rounded to before
+        lookup, a scalar or one value for each parameter.
+
+    Cached values are discarded when the emulator is refitted or given new
+    data. Gradients (``evaluateS1``) are passed to the emulator without
+    caching.
+    The cache is not thread safe; use a separate instance in every thread.
+    """
+
+    def __init__(self, emulator, max_size=100000, resolution=None):
+        if max_size < 1:
+            raise ValueError("Cache size must be positive")
+
+        self._emulator = emulator
+        self._n_parameters = emulator.n_parameters()
+        self._max_size = int(max_size)
+
+        if resolution is not None:
+            resolution = np.array(resolution, dtype=float)
+            if np.any(resolution <= 0):
+                raise ValueError("Resolution must be positive")
+            if resolution.ndim == 0:
+                resolution = np.ones(self._n_parameters) * resolution
+            if resolution.shape != (self._n_parameters, ):
+                raise ValueError(
+                    "Resolution should be a scalar or have n_parameters "
+                    "values")
+        self._resolution = resolution
+
+        self._values = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+        # version of the emulator the cached values were predicted with
+        self._versioned = emutils._find_emulator(emulator)
+        self._seen_version = self._current_version()
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 2:
+            return self.evaluate_batch(x)
+
+        self._check_version()
+        key = self._key(x)
+        try:
+            value = self._values[key]
+        except KeyError:
+            self._misses += 1
+            value = float(self._emulator(x))
+            self._store(key, value)
+        else:
+            self._hits += 1
+            self._values.move_to_end(key)
+        return value
+
+    def evaluate_batch(self, X):
+        """
+        Returns the emulated log-likelihood for every row of ``X``. Points
+        not in the cache are predicted with a single batched call, and
+        every distinct point only once.
+        """
+        X = _batch_array(X, self._n_parameters)
+
+        self._check_version()
+        values = np.empty(len(X))
+        missing = collections.OrderedDict()
+        for i, x in enumerate(X):
+            key = self._key(x)
+            value = self._values.get(key)
+            if value is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                values[i] = value
+                self._values.move_to_end(key)
+
+        # repeated points within the batch are predicted once
+        self._hits += len(X) - len(missing)
+        self._misses += len(missing)
+        if missing:
+            rows = [indices[0] for indices in missing.values()]
+            predicted = emutils.evaluate_batch(self._emulator, X[rows])
+            for (key, indices), value in zip(missing.items(), predicted):
+                values[indices] = value
+                self._store(key, float(value))
+
+        return values
+
+    def evaluateS1(self, x):
+        """
+        Returns the value and gradient computed by the emulator.
+        """
+        return self._emulator.evaluateS1(x)
+
+    def n_parameters(self):
+        return self._n_parameters
+
+    def clear(self):
+        """
+        Removes all cached values and resets the statistics.
+        """
+        self._values.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def statistics(self):
+        """
+        Returns a dictionary with the number of cache hits and misses, the
+        hit rate and the number of values currently cached.
+        """
+        n_calls = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / n_calls if n_calls else 0.,
+            "size": len(self._values),
+            "max_size": self._max_size,
+        }
+
+    def _current_version(self):
+        if self._versioned is None:
+            return None
+        return self._versioned._version
+
+    def _check_version(self):
+        """
+        Empties the cache if the emulator changed since values were cached.
+        """
+        version = self._current_version()
+        if version != self._seen_version:
+            self._values.clear()
+            self._seen_version = version
+
+    def _key(self, x):
+        if self._resolution is None:
+            return x.tobytes()
+        return np.round(x / self._resolution).astype(np.int64).tobytes()
+
+    def _store(self, key, value):
+        self._values[key] = value
+        if len(self._values) > self._max_size:
+            self._values.popitem(last=False)
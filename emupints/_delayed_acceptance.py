@@ -0,0 +1,236 @@
+#
+# Delayed-acceptance MCMC: screen proposals with the emulator
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import pints
+
+
+class DelayedAcceptanceMCMC(object):
+    """
+    Two-stage Metropolis sampler that uses an emulator to screen proposals
+    before the true likelihood is evaluated [1].
+
+    Every proposal is first accepted or rejected using the emulated
+    posterior. Only proposals passing this stage are evaluated with the true
+    likelihood, and are then accepted with probability
+
+        min(1, pi(y) pi*(x) / (pi(x) pi*(y)))
+
+    where pi is the true and pi* the emulated posterior. This corrects for
+    the emulator error, so the chain samples the true posterior exactly,
+    while most poor proposals never reach the (expensive) simulator.
+
+    Proposals are made by a Gaussian random walk. By default its covariance
+    is adapted during the run as in :class:`pints.HaarioBardenetACMC`.
+
+    [1] Christen, J. A. and Fox, C. (2005) Markov chain Monte Carlo using an
+    approximation. Journal of Computational and Graphical Statistics.
+
+    Arguments:
+
+    ``log_likelihood``
+        A :class:`LogPDF`, the true (expensive) likelihood, e.g. from
+        :meth:`Problems.load_problem`.
+    ``emulator``
+        A cheap approximation of ``log_likelihood``, e.g. a fitted
+        :class:`GPEmulator` or :class:`NNEmulator`.
+    ``log_prior``
+        A :class:`LogPrior`.
+    ``x0``
+        Starting point of the chain.
+    ``sigma0``
+        (Optional) Initial covariance matrix of the proposal, or a vector of
+        standard deviations for each parameter.
+    ``seed``
+        (Optional) Seed of the random number generator.
+    """
+
+    def __init__(self, log_likelihood, emulator, log_prior, x0, sigma0=None,
+                 seed=None):
+        if not isinstance(log_likelihood, pints.LogPDF):
+            raise ValueError("Given pdf must extend LogPDF")
+        if emulator.n_parameters() != log_likelihood.n_parameters():
+            raise ValueError("Emulator and likelihood dimensions don't match")
+
+        self._log_likelihood = log_likelihood
+        self._emulator = emulator
+        self._log_prior = log_prior
+        self._n_parameters = log_likelihood.n_parameters()
+
+        self._x0 = np.array(x0, dtype=float).reshape(self._n_parameters)
+        if sigma0 is None:
+            sigma0 = np.abs(self._x0) / 10
+            sigma0[sigma0 == 0] = 1
+        sigma0 = np.array(sigma0, dtype=float)
+        if sigma0.ndim == 1:
+            sigma0 = np.diag(sigma0 ** 2)
+        self._sigma0 = sigma0
+
+        self._random = np.random.RandomState(seed)
+
+        self._adaptive = True
+        self._initial_phase_iterations = 200
+        self._target_acceptance = 0.234
+        self._eta = 0.6
+
+        self._chain = None
+        self._reset_counters()
+
+    def set_parameters(
+            self,
+            adaptive=None,
+            initial_phase_iterations=None,
+            target_acceptance=None):
+        """
+        Sets parameters of the proposal.
+
+        ``adaptive``
+            If True the proposal covariance and its scale are adapted after
+            the initial phase. Adaptation diminishes over time, so the chain
+            still converges to the true posterior.
+        ``initial_phase_iterations``
+            Number of iterations run with the initial proposal.
+        ``target_acceptance``
+            Overall acceptance rate the proposal scale is adapted to.
+        """
+        if adaptive is not None:
+            self._adaptive = bool(adaptive)
+
+        if initial_phase_iterations is not None:
+            self._initial_phase_iterations = initial_phase_iterations
+
+        if target_acceptance is not None:
+            if not 0 < target_acceptance < 1:
+                raise ValueError("Target acceptance must be in (0, 1)")
+            self._target_acceptance = target_acceptance
+
+    def run(self, n_iterations, messages=False):
+        """
+        Runs the chain for ``n_iterations`` and returns it as an
+        n_iterations by n_parameters array, starting with ``x0``.
+        Counters of the run are available through :meth:`counters`.
+        """
+        self._reset_counters()
+
+        x = self._x0
+        log_prior = self._log_prior(x)
+        emulated = self._emulator(x)
+        true = self._log_likelihood(x)
+        self._n_emulator_evaluations += 1
+        self._n_true_evaluations += 1
+        if not np.isfinite(log_prior + true):
+            raise ValueError("Initial point has zero posterior density")
+
+        mu = np.array(x)
+        sigma = np.array(self._sigma0)
+        log_lambda = 0.
+
+        chain = np.zeros((n_iterations, self._n_parameters))
+        chain[0] = x
+        for i in range(1, n_iterations):
+            y = self._random.multivariate_normal(x, np.exp(log_lambda) * sigma)
+            accepted = False
+
+            # stage 1: emulated posterior, with a symmetric proposal
+            y_log_prior = self._log_prior(y)
+            if np.isfinite(y_log_prior):
+                y_emulated = self._emulator(y)
+                self._n_emulator_evaluations += 1
+
+                log_ratio = (y_log_prior + y_emulated) - (log_prior + emulated)
+                if np.log(self._random.uniform()) < log_ratio:
+                    # stage 2: correct for the emulator error
+                    y_true = self._log_likelihood(y)
+                    self._n_true_evaluations += 1
+
+                    log_ratio = (y_true - true) - (y_emulated - emulated)
+                    if np.log(self._random.uniform()) < log_ratio:
+                        accepted = True
+                    else:
+                        self._n_stage2_rejected += 1
+                else:
+                    self._n_stage1_rejected += 1
+            else:
+                self._n_stage1_rejected += 1
+
+            if accepted:
+                x = y
+                log_prior = y_log_prior
+                emulated = y_emulated
+                true = y_true
+                self._n_accepted += 1
+            chain[i] = x
+
+            if self._adaptive and i >= self._initial_phase_iterations:
+                gamma = (i - self._initial_phase_iterations + 1) ** -self._eta
+                dx = x - mu
+                mu = mu + gamma * dx
+                sigma = sigma + gamma * (np.outer(dx, dx) - sigma)
+                log_lambda += gamma * (accepted - self._target_acceptance)
+
+            if messages and (i + 1) % 1000 == 0:
+                counters = self.counters()
+                print("Iteration {}: acceptance {:.3f}, screened {:.3f}, "
+                      "true evaluations {}".format(
+                          i + 1,
+                          counters["acceptance_rate"],
+                          counters["screening_rate"],
+                          self._n_true_evaluations))
+
+        self._chain = chain
+        return chain
+
+    def _reset_counters(self):
+        self._n_emulator_evaluations = 0
+        self._n_true_evaluations = 0
+        self._n_stage1_rejected = 0
+        self._n_stage2_rejected = 0
+        self._n_accepted = 0
+
+    def counters(self):
+        """
+        Returns a dictionary of counters of the last run:
+
+        - n_proposals: number of proposals made.
+        - n_emulator_evaluations, n_true_evaluations: calls of the emulator
+          and of the true likelihood, including the starting point.
+        - n_stage1_rejected: proposals rejected by the emulator (or prior)
+          without evaluating the true likelihood.
+        - n_stage2_rejected: proposals passing the emulator but rejected
+          after evaluating the true likelihood.
+        - n_accepted: accepted proposals.
+        - screening_rate: fraction of proposals rejected by the emulator.
+        - acceptance_rate: fraction of proposals accepted.
+        - stage2_acceptance_rate: fraction of true likelihood evaluations
+          that were accepted, close to 1 for an accurate emulator.
+        """
+        n_proposals = self._n_stage1_rejected + self._n_stage2_rejected + \
+            self._n_accepted
+        n_stage2 = self._n_stage2_rejected + self._n_accepted
+
+        return {
+            "n_proposals": n_proposals,
+            "n_emulator_evaluations": self._n_emulator_evaluations,
+            "n_true_evaluations": self._n_true_evaluations,
+            "n_stage1_rejected": self._n_stage1_rejected,
+            "n_stage2_rejected": self._n_stage2_rejected,
+            "n_accepted": self._n_accepted,
+            "screening_rate":
+                self._n_stage1_rejected / n_proposals if n_proposals else 0.,
+            "acceptance_rate":
+                self._n_accepted / n_proposals if n_proposals else 0.,
+            "stage2_acceptance_rate":
+                self._n_accepted / n_stage2 if n_stage2 else 0.,
+        }
+
+    def chain(self):
+        """
+        Returns the chain of the last run.
+        """
+        assert self._chain is not None, "Must first run the sampler"
+
+        return self._chain
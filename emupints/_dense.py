@@ -0,0 +1,155 @@
+#
+# NumPy forward pass of a stack of dense layers
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+
+
+class DenseNetwork(object):
+    """
+    Feed-forward network of dense layers evaluated with NumPy only.
+    Used for fast inference of the models created by :mod:`models`, which
+    avoids the overhead of Keras' predict() for every call.
+
+    Arguments:
+
+    ``weights``
+        List of weight matrices, one (n_inputs, n_units) per layer.
+    ``biases``
+        List of bias vectors, one (n_units,) per layer.
+    ``activations``
+        List of activation names, one per layer, see :data:`ACTIVATIONS`.
+    """
+
+    def __init__(self, weights, biases, activations):
+        if not (len(weights) == len(biases) == len(activations)):
+            raise ValueError("Each layer needs weights, bias and activation")
+
+        for name in activations:
+            if name not in ACTIVATIONS:
+                raise ValueError("Unsupported activation: " + str(name))
+
+        self._weights = [np.asarray(w, dtype=float) for w in weights]
+        self._biases = [np.asarray(b, dtype=float) for b in biases]
+        self._activations = list(activations)
+        self._functions = [ACTIVATIONS[name] for name in activations]
+
+    def __call__(self, X):
+        """
+        Returns network outputs for an N by n_inputs matrix.
+        """
+        a = X
+        for W, b, f in zip(self._weights, self._biases, self._functions):
+            a = f(np.dot(a, W) + b)
+        return a
+
+    def gradient(self, X):
+        """
+        Returns network outputs (N by n_outputs) and their derivatives with
+        respect to the inputs (N by n_inputs by n_outputs), computed by
+        backpropagation through the layers.
+        """
+        a = X
+        layers = []
+        for W, b, f in zip(self._weights, self._biases, self._functions):
+            z = np.dot(a, W) + b
+            a = f(z)
+            layers.append((z, a))
+
+        # G[m, i, k] = d output_k / d activation_i of the current layer
+        n_outputs = a.shape[1]
+        G = np.tile(np.eye(n_outputs), (len(X), 1, 1))
+        for W, name, (z, a) in reversed(list(zip(
+                self._weights, self._activations, layers))):
+            G = G * DERIVATIVES[name](z, a)[:, :, None]
+            G = np.einsum("ij,mjk->mik", W, G)
+
+        return layers[-1][1], G
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Extracts weights and activations of a Keras model made of Dense
+        layers (Dropout and Input layers are skipped as they do nothing at
+        inference). Raises ValueError for any other layers or activations.
+        """
+        weights, biases, activations = [], [], []
+        for layer in model.layers:
+            layer_type = type(layer).__name__
+            if layer_type in ("Dropout", "InputLayer"):
+                continue
+            if layer_type != "Dense":
+                raise ValueError("Unsupported layer: " + layer_type)
+
+            W, b = layer.get_weights()
+            weights.append(W)
+            biases.append(b)
+            activations.append(getattr(layer.activation, "__name__", None))
+
+        return cls(weights, biases, activations)
+
+    def weights(self):
+        """
+        Returns lists of weights, biases and activation names of all layers.
+        """
+        return self._weights, self._biases, self._activations
+
+
+def _leaky_relu(x):
+    # same slope as tf.nn.leaky_relu used by models
+    return np.where(x > 0, x, 0.2 * x)
+
+
+def _identity(x):
+    return x
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def _leaky_relu_dz(z, a):
+    return np.where(z > 0, 1., 0.2)
+
+
+def _identity_dz(z, a):
+    return np.ones_like(z)
+
+
+def _relu_dz(z, a):
+    return (z > 0).astype(float)
+
+
+def _tanh_dz(z, a):
+    return 1. - a ** 2
+
+
+def _sigmoid_dz(z, a):
+    return a * (1. - a)
+
+
+ACTIVATIONS = {
+    "leaky_relu": _leaky_relu,
+    "identity": _identity,
+    "linear": _identity,
+    "relu": _relu,
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+}
+
+# Derivatives of the activations, given pre-activation z and activation a
+DERIVATIVES = {
+    "leaky_relu": _leaky_relu_dz,
+    "identity": _identity_dz,
+    "linear": _identity_dz,
+    "relu": _relu_dz,
+    "tanh": _tanh_dz,
+    "sigmoid": _sigmoid_dz,
+}
@@ -5,14 +5,45 @@
 from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
+from ._profiling import Profiler
 import numpy as np
+import importlib
+import pickle
 import pints
-import copy
+import os
 
 
-class Emulator(pints.LogPDF):
+# Newer versions of pints only accept a LogLikelihood in LogPosterior
+_LogLikelihood = getattr(pints, "LogLikelihood", pints.LogPDF)
+
+
+class _InputHandling(object):
+    """
+    Validation and scaling of inputs shared by emulators, which set
+    ``_n_parameters``, ``_input_scaler`` and ``_input_affine``.
+    """
+
+    def _as_batch(self, X):
+        """
+        Converts given input to a 2 dimensional (N, n_parameters) array
+        """
+        return _batch_array(X, self._n_parameters)
+
+    def _transform_input(self, X):
+        """
+        Applies input scaler (if any) to a batch of inputs
+        """
+        if self._input_affine is not None:
+            scale, offset = self._input_affine
+            return X * scale + offset
+        if self._input_scaler:
+            return self._input_scaler.transform(X)
+        return X
+
+
+class Emulator(_LogLikelihood, _InputHandling):
     """
-    *Extends:* :class:`LogPDF`
+    *Extends:* :class:`LogLikelihood` (:class:`LogPDF` for older pints)
 
     Abstract class from which all emulators should inherit.
     An instance of the Emulator models given log-likelihood
@@ -30,10 +61,30 @@ class Emulator(pints.LogPDF):
         E.g. StandardScaler provides standardization.
     ``output_scaler``
         sklearn scaler class that will be applied to output
+    ``copy``
+        (Optional) If False, unscaled training data is not copied: the
+        emulator keeps a read-only view of the given arrays, which must not
+        be changed afterwards. Memory-mapped arrays (e.g. from
+        ``np.load(path, mmap_mode="r")``) then stay on disk.
+    ``dtype``
+        (Optional) Data type training data is stored as, e.g.
+        ``np.float32`` to halve its memory. GPy converts data to float64
+        when fitting, so this mainly helps emulators not built on GPy.
+
+    Calls and training can be instrumented with :meth:`enable_profiling`.
     """
 
+    # set by enable_profiling(), a class attribute so that loaded emulators
+    # are not profiled either
+    _profiler = None
+
+    # incremented whenever predictions change, e.g. after fitting, so that
+    # values memoised elsewhere (e.g. plotted surfaces) can be invalidated
+    _version = 0
+
     def __init__(self, log_likelihood, X, y,
-                 input_scaler=False, output_scaler=False):
+                 input_scaler=False, output_scaler=False, copy=True,
+                 dtype=None):
         # Perform sanity checks for given data
         if not isinstance(log_likelihood, pints.LogPDF):
             raise ValueError("Given pdf must extend LogPDF")
@@ -74,16 +125,320 @@ class Emulator(pints.LogPDF):
         if output_scaler:
             self._output_scaler.fit(y)
 
-        # copy input data to avoid possible changes to it outside the class
+        # copy input data to avoid possible changes to it outside the class,
+        # scaled data is a new array already
         if input_scaler:
-            self._X = self._input_scaler.transform(X)
+            self._X = np.asarray(self._input_scaler.transform(X), dtype=dtype)
         else:
-            self._X = copy.deepcopy(X)
+            self._X = _training_array(X, copy, dtype)
 
         if output_scaler:
-            self._y = self._output_scaler.transform(y)
+            self._y = np.asarray(self._output_scaler.transform(y), dtype=dtype)
         else:
-            self._y = copy.deepcopy(y)
+            self._y = _training_array(y, copy, dtype)
+
+        # most scalers are elementwise affine maps, which can be applied
+        # with NumPy directly instead of going through sklearn's validation
+        self._input_affine = None
+        if input_scaler:
+            self._input_affine = affine_map(
+                self._input_scaler.transform, self._n_parameters)
+
+        self._output_affine = None
+        if output_scaler:
+            self._output_affine = affine_map(
+                self._output_scaler.inverse_transform, 1)
 
     def n_parameters(self):
         return self._n_parameters
+
+    def _changed(self):
+        """
+        Marks predictions of the emulator as changed, called by subclasses
+        after fitting or adding data.
+        """
+        self._version += 1
+
+    def enable_profiling(self, profiler=None):
+        """
+        Starts recording call counts, batch sizes, latencies of the stages
+        of predictions and the time spent fitting in ``profiler`` (a new
+        :class:`Profiler` by default), which is returned.
+        """
+        if profiler is None:
+            profiler = Profiler()
+        self._profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        """
+        Stops recording measurements, the profiler keeps those recorded.
+        """
+        self.__dict__.pop("_profiler", None)
+
+    def get_profiler(self):
+        """
+        Returns the attached :class:`Profiler`, or None if profiling is
+        disabled.
+        """
+        return self._profiler
+
+    def __call__(self, x):
+        """
+        Returns the emulated log-likelihood. A single parameter vector gives
+        a float, an N by n_parameters matrix is handled as a batch and
+        gives an array of N values (see :meth:`evaluate_batch`).
+        """
+        x = np.asarray(x)
+        if x.ndim == 2:
+            return self.evaluate_batch(x)
+
+        profiler = self._profiler
+        if profiler is None:
+            x = x.reshape((1, self._n_parameters))
+            return float(self._predict(x)[0, 0])
+
+        start = profiler.clock()
+        x = x.reshape((1, self._n_parameters))
+        profiler.lap("reshape", start, 1)
+        y = float(self._predict(x)[0, 0])
+        profiler.lap("__call__", start, 1)
+        return y
+
+    def evaluate_batch(self, X):
+        """
+        Returns the emulated log-likelihood for every row of ``X``, an
+        N by n_parameters matrix, as an array of length N. The whole batch
+        is predicted at once, so scalers are applied a single time.
+        """
+        profiler = self._profiler
+        if profiler is None:
+            X = self._as_batch(X)
+            return self._predict(X).reshape(len(X))
+
+        start = profiler.clock()
+        X = self._as_batch(X)
+        profiler.lap("reshape", start, len(X))
+        y = self._predict(X).reshape(len(X))
+        profiler.lap("evaluate_batch", start, len(X))
+        return y
+
+    def _predict(self, X):
+        """
+        Predicts an N by n_parameters matrix of inputs, returns an N by 1
+        array in the original output scale.
+        """
+        profiler = self._profiler
+        if profiler is None:
+            y = self._predict_scaled(self._transform_input(X))
+            return self._inverse_transform_output(y)
+
+        start = profiler.clock()
+        X = self._transform_input(X)
+        start = profiler.lap("transform_input", start, len(X))
+        y = self._predict_scaled(X)
+        start = profiler.lap(self._predict_stage(), start, len(X))
+        y = self._inverse_transform_output(y)
+        profiler.lap("inverse_transform_output", start, len(X))
+        return y
+
+    def _predict_scaled(self, X):
+        """
+        Predicts an N by n_parameters matrix of scaled inputs, returns an
+        N by 1 array in the scale of the output scaler. Implemented by
+        subclasses, used by :meth:`__call__` and :meth:`evaluate_batch`.
+        """
+        raise NotImplementedError
+
+    def _predict_stage(self):
+        """
+        Returns the name under which :meth:`_predict_scaled` is profiled.
+        """
+        return "predict"
+
+    def evaluateS1(self, x):
+        """
+        Returns the emulated log-likelihood and its gradient with respect to
+        the parameters, see :meth:`pints.LogPDF.evaluateS1`.
+        """
+        y, dy = self.evaluateS1_batch(self._as_batch(x))
+        return float(y[0]), dy[0]
+
+    def evaluateS1_batch(self, X):
+        """
+        Returns the emulated log-likelihood (an array of length N) and its
+        gradients (N by n_parameters) for every row of ``X``.
+        Implemented by subclasses that support derivatives.
+        """
+        raise NotImplementedError
+
+    def _inverse_transform_gradient(self, dy):
+        """
+        Maps gradients (N by n_parameters) of the scaled output with respect
+        to scaled inputs to gradients in the original scales. Only affine
+        scalers are supported.
+        """
+        if self._input_scaler:
+            if self._input_affine is None:
+                raise ValueError("Gradients need an affine input scaler")
+            dy = dy * self._input_affine[0]
+        if self._output_scaler:
+            if self._output_affine is None:
+                raise ValueError("Gradients need an affine output scaler")
+            dy = dy * self._output_affine[0]
+        return dy
+
+    def save(self, path):
+        """
+        Writes the emulator to the directory ``path`` (created if needed),
+        so that it can be restored with :meth:`load` without refitting.
+        Training data is stored as ``.npy`` files, which are memory-mapped
+        when loading.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        np.save(os.path.join(path, "X.npy"), np.asarray(self._X))
+        np.save(os.path.join(path, "y.npy"), np.asarray(self._y))
+
+        state = {
+            "class": (type(self).__module__, type(self).__name__),
+            "n_parameters": self._n_parameters,
+            "input_scaler": self._input_scaler,
+            "output_scaler": self._output_scaler,
+            "input_affine": self._input_affine,
+            "output_affine": self._output_affine,
+        }
+        state.update(self._save_state(path))
+
+        # written last, so a directory without it is an incomplete save
+        with open(os.path.join(path, "emulator.pkl"), "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Restores an emulator written by :meth:`save`. The returned object is
+        an instance of the class that was saved, which must be ``cls`` or a
+        subclass of it. Training data is memory-mapped read-only unless
+        ``mmap`` is False.
+        """
+        with open(os.path.join(path, "emulator.pkl"), "rb") as f:
+            state = pickle.load(f)
+
+        module, name = state["class"]
+        emulator_class = getattr(importlib.import_module(module), name)
+        if not issubclass(emulator_class, cls):
+            raise ValueError("Saved emulator is a " + name)
+
+        # skip __init__, nothing has to be fitted again
+        emulator = emulator_class.__new__(emulator_class)
+        mmap_mode = "r" if mmap else None
+        emulator._X = np.load(os.path.join(path, "X.npy"), mmap_mode=mmap_mode)
+        emulator._y = np.load(os.path.join(path, "y.npy"), mmap_mode=mmap_mode)
+        emulator._n_parameters = state["n_parameters"]
+        emulator._input_scaler = state["input_scaler"]
+        emulator._output_scaler = state["output_scaler"]
+        emulator._input_affine = state["input_affine"]
+        emulator._output_affine = state["output_affine"]
+        emulator._load_state(path, state, mmap_mode)
+
+        return emulator
+
+    def _save_state(self, path):
+        """
+        Returns a dictionary with state of the subclass to be pickled by
+        save(), which can also write additional files to ``path``.
+        By default all attributes not set by Emulator are pickled.
+        """
+        return {"attributes": dict(
+            (name, value) for name, value in self.__dict__.items()
+            if name not in _EMULATOR_STATE and name != "_profiler")}
+
+    def _load_state(self, path, state, mmap_mode):
+        """
+        Restores state of the subclass returned by _save_state().
+        """
+        self.__dict__.update(state.get("attributes", {}))
+
+    def _transform_output(self, y):
+        """
+        Applies output scaler (if any) to a batch of targets (N by 1)
+        """
+        if self._output_affine is not None:
+            scale, offset = self._output_affine
+            return (y - offset) / scale
+        if self._output_scaler:
+            return self._output_scaler.transform(y)
+        return y
+
+    def _inverse_transform_output(self, y):
+        """
+        Maps a batch of predictions (N by 1) back to the original scale
+        """
+        if self._output_affine is not None:
+            scale, offset = self._output_affine
+            return y * scale + offset
+        if self._output_scaler:
+            return self._output_scaler.inverse_transform(y)
+        return y
+
+
+# Attributes set by Emulator, written to disk by save() itself
+_EMULATOR_STATE = ("_n_parameters", "_X", "_y", "_input_scaler",
+                   "_output_scaler", "_input_affine", "_output_affine")
+
+
+def _batch_array(X, n_parameters):
+    """
+    Converts given input to a 2 dimensional (N, n_parameters) array, a
+    single parameter vector gives a batch of one.
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape((1, len(X)))
+
+    if X.ndim != 2 or X.shape[1] != n_parameters:
+        raise ValueError("Input should have shape (N, n_parameters)")
+
+    return X
+
+
+def _training_array(array, copy, dtype):
+    """
+    Returns a copy of the given array, or a read-only view of it if
+    ``copy`` is False (converted to ``dtype`` if given).
+    """
+    if copy:
+        return np.array(array, dtype=dtype)
+
+    view = np.asarray(array, dtype=dtype).view()
+    view.flags.writeable = False
+    return view
+
+
+def affine_map(transform, n_features):
+    """
+    Returns ``(scale, offset)`` such that ``transform(X)`` equals
+    ``X * scale + offset`` for any N by n_features matrix ``X``, or ``None``
+    if the given transformation is not an elementwise affine map.
+    Used to evaluate fitted sklearn scalers (StandardScaler, MinMaxScaler,
+    MaxAbsScaler, RobustScaler) without sklearn overhead.
+    """
+    try:
+        offset = np.asarray(transform(np.zeros((1, n_features))), dtype=float)
+        scale = np.asarray(transform(np.ones((1, n_features))), dtype=float)
+        scale = scale - offset
+
+        # check map on a few arbitrary points
+        probe = np.random.RandomState(0).normal(size=(4, n_features)) * 10
+        expected = np.asarray(transform(probe), dtype=float)
+    except Exception:
+        return None
+
+    if (expected.shape != probe.shape or
+            not np.allclose(probe * scale + offset, expected,
+                            rtol=1e-10, atol=1e-12)):
+        return None
+
+    return scale.reshape(n_features), offset.reshape(n_features)
@@ -0,0 +1,260 @@
+#
+# Shared server evaluating batches of points for many clients
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import _batch_array
+import multiprocessing
+import threading
+import numpy as np
+import queue
+
+
+class EvaluationServer(object):
+    """
+    Evaluates an emulator in a dedicated thread (or process) on behalf of
+    many clients, e.g. MCMC chains or controllers running in other threads.
+
+    Requests that are waiting at the same time are merged into a single
+    call of ``evaluate_batch`` (or ``evaluateS1_batch``), so the cost of
+    predicting with a GP or neural network is shared by all clients.
+    The server provides the same batch interface as the emulators, so it
+    can be passed wherever an emulator is expected, in particular to
+    :class:`BatchedMCMCController`.
+
+    With ``process=True`` the batches are evaluated in a separate process
+    holding a copy of the emulator, so evaluation doesn't compete with the
+    clients for the Python interpreter lock.
+
+    Arguments:
+
+    ``emulator``
+        Emulator, or any :class:`LogPDF` providing ``evaluate_batch``.
+    ``process``
+        (Optional) Evaluate in a worker process instead of a thread.
+    ``max_batch_size``
+        (Optional) Maximum number of points evaluated in one call.
+
+    Use :meth:`start` and :meth:`stop`, or the server as a context manager::
+
+        with EvaluationServer(emulator) as server:
+            controller = BatchedMCMCController(server, log_prior, x0)
+            chains = controller.run()
+    """
+
+    def __init__(self, emulator, process=False, max_batch_size=None):
+        self._emulator = emulator
+        self._n_parameters = emulator.n_parameters()
+        self._process = process
+        self._max_batch_size = max_batch_size
+
+        self._requests = queue.Queue()
+        self._thread = None
+        self._worker = None
+        self._connection = None
+
+        self._lock = threading.Lock()
+        self._n_requests = 0
+        self._n_batches = 0
+        self._n_points = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the server thread, and worker process if requested.
+        """
+        if self._thread is not None:
+            return
+
+        if self._process:
+            self._connection, child = multiprocessing.Pipe()
+            self._worker = multiprocessing.Process(
+                target=_serve, args=(self._emulator, child))
+            self._worker.daemon = True
+            self._worker.start()
+            child.close()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the server once pending requests are evaluated.
+        """
+        if self._thread is None:
+            return
+
+        self._requests.put(None)
+        self._thread.join()
+        self._thread = None
+
+        if self._worker is not None:
+            self._connection.send(None)
+            self._worker.join()
+            self._connection.close()
+            self._worker = None
+            self._connection = None
+
+    def __call__(self, x):
+        x = np.asarray(x)
+        if x.ndim == 2:
+            return self.evaluate_batch(x)
+        return float(self.evaluate_batch(x)[0])
+
+    def evaluate_batch(self, X):
+        """
+        Returns the emulated log-likelihood for every row of ``X``, blocks
+        until the server has evaluated them.
+        """
+        return self._submit("values", X)
+
+    def evaluateS1(self, x):
+        """
+        Returns the emulated log-likelihood and its gradient.
+        """
+        y, dy = self.evaluateS1_batch(x)
+        return float(y[0]), dy[0]
+
+    def evaluateS1_batch(self, X):
+        """
+        Returns the emulated log-likelihood (an array of length N) and its
+        gradients (N by n_parameters) for every row of ``X``.
+        """
+        return self._submit("gradients", X)
+
+    def n_parameters(self):
+        return self._n_parameters
+
+    def statistics(self):
+        """
+        Returns a dictionary with the number of requests received, batches
+        evaluated and points evaluated so far.
+        """
+        with self._lock:
+            return {
+                "n_requests": self._n_requests,
+                "n_batches": self._n_batches,
+                "n_points": self._n_points,
+            }
+
+    def _submit(self, kind, X):
+        if self._thread is None:
+            raise RuntimeError("Server must first be started")
+
+        X = _batch_array(X, self._n_parameters)
+
+        request = _Request(kind, X)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _run(self):
+        """
+        Server loop: takes all waiting requests and evaluates them together.
+        """
+        stopping = False
+        while not stopping:
+            pending = [self._requests.get()]
+            while True:
+                try:
+                    pending.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in pending:
+                stopping = True
+                pending = [r for r in pending if r is not None]
+
+            for kind in ("values", "gradients"):
+                requests = [r for r in pending if r.kind == kind]
+                while requests:
+                    batch = self._take_batch(requests)
+                    self._evaluate(kind, batch)
+
+    def _take_batch(self, requests):
+        """
+        Removes requests from the list until the batch is full.
+        """
+        batch = [requests.pop(0)]
+        n_points = len(batch[0].X)
+        while requests and (self._max_batch_size is None or
+                            n_points + len(requests[0].X) <=
+                            self._max_batch_size):
+            n_points += len(requests[0].X)
+            batch.append(requests.pop(0))
+        return batch
+
+    def _evaluate(self, kind, batch):
+        X = np.vstack([r.X for r in batch])
+        try:
+            if self._worker is not None:
+                self._connection.send((kind, X))
+                status, result = self._connection.recv()
+                if status == "error":
+                    raise result
+            else:
+                result = _evaluate(self._emulator, kind, X)
+        except Exception as e:
+            for r in batch:
+                r.error = e
+                r.done.set()
+            return
+
+        with self._lock:
+            self._n_requests += len(batch)
+            self._n_batches += 1
+            self._n_points += len(X)
+
+        start = 0
+        for r in batch:
+            end = start + len(r.X)
+            if kind == "values":
+                r.result = result[start:end]
+            else:
+                r.result = (result[0][start:end], result[1][start:end])
+            start = end
+            r.done.set()
+
+
+class _Request(object):
+    def __init__(self, kind, X):
+        self.kind = kind
+        self.X = X
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _evaluate(emulator, kind, X):
+    if kind == "values":
+        return np.asarray(emulator.evaluate_batch(X), dtype=float).reshape(
+            len(X))
+    return emulator.evaluateS1_batch(X)
+
+
+def _serve(emulator, connection):
+    """
+    Evaluates batches received through ``connection`` until None is sent,
+    runs in the worker process.
+    """
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        kind, X = message
+        try:
+            connection.send(("ok", _evaluate(emulator, kind, X)))
+        except Exception as e:
+            connection.send(("error", e))
+    connection.close()
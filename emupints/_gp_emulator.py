@@ -6,10 +6,17 @@ from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
 from ._emulator import Emulator
+from ._gp_predictor import compile_mean_predictor
+from . import utils as emutils
+import multiprocessing
 import warnings
 import numpy as np
-import copy
-import GPy
+import pickle
+import copy as _copy
+import time
+import os
+
+from scipy.linalg import cho_solve, cholesky, solve_triangular
 
 
 class GPEmulator(Emulator):
@@ -26,26 +33,47 @@ class GPEmulator(Emulator):
         N by n_paremeters matrix containing inputs for training data
     ``y``
         N by 1, target values for each input vector
+
+    For large training sets use a sparse GP by providing the number of
+    inducing points, e.g. ``set_parameters(n_inducing=200)``. Fitting then
+    scales linearly with N instead of cubically.
+
+    A fitted emulator can be written to disk with :meth:`save` and restored
+    with :meth:`load`. Restored emulators predict with NumPy straight away;
+    GPy is only imported and the GPy model only rebuilt once it is needed,
+    e.g. for variances or further optimization.
     """
 
     def __init__(self, log_likelihood, X, y, **kwargs):
         super(GPEmulator, self).__init__(log_likelihood, X, y, **kwargs)
+        import GPy
 
         # default model is Regression
         self.set_parameters(model=GPy.models.GPRegression)
 
-    def __call__(self, x):
-        assert hasattr(self, "_gp"), "Must first fit GP to data"
+        # NumPy predictive mean, built after every fit
+        self._predictor = None
 
-        # convert to np array
-        #if type(x) != np.ndarray:
-        #    x = np.asarray(x)
+        # Cholesky factor of the kernel matrix kept up to date by add_data(),
+        # while the GPy model is only updated once it is needed
+        self._chol = None
+        self._gp_stale = False
 
-        x = x.reshape((1, self._n_parameters))
-        if self._input_scaler:
-            x = self._input_scaler.transform(x)
+    def __getattr__(self, name):
+        # GPy state of an emulator restored by load() is unpickled on first
+        # access only
+        if name in _GPY_STATE and "_gp_pickle" in self.__dict__:
+            self._restore_gp()
+            return getattr(self, name)
+        raise AttributeError(name)
 
-        y = self._gp.predict_noiseless(x)[0]
+    def _predict_scaled(self, X):
+        """
+        Predicts noiseless mean for an N by n_parameters matrix of scaled
+        inputs, with NumPy if the predictor could be compiled.
+        """
+        assert self._predictor is not None or hasattr(self, "_gp"), \
+            "Must first fit GP to data"
 
         """
         TODO: include warnings?
@@ -54,10 +82,37 @@ class GPEmulator(Emulator):
                           "Indicative of high uncertainty in predictions.")
         """
 
-        if self._output_scaler:
-            y = self._output_scaler.inverse_transform(y)
+        if self._predictor is not None:
+            return self._predictor(X)
+        return self._gp.predict_noiseless(X)[0]
+
+    def _predict_stage(self):
+        if self._predictor is not None:
+            return "predict_numpy"
+        return "predict_gpy"
 
-        return y
+    def evaluateS1_batch(self, X):
+        """
+        Returns the emulated log-likelihood (an array of length N) and its
+        gradients (N by n_parameters) for every row of ``X``.
+        Gradients of the predictive mean are computed analytically from the
+        cached posterior weights, or with GPy's predictive_gradients() for
+        kernels that can't be compiled to NumPy.
+        """
+        assert self._predictor is not None or hasattr(self, "_gp"), \
+            "Must first fit GP to data"
+
+        X = self._as_batch(X)
+        Z = self._transform_input(X)
+        if self._predictor is not None:
+            mu, dmu = self._predictor.gradient(Z)
+        else:
+            self._sync_gp()
+            mu = self._gp.predict_noiseless(Z)[0]
+            dmu = self._gp.predictive_gradients(Z)[0]
+
+        y = self._inverse_transform_output(mu).reshape(len(X))
+        return y, self._inverse_transform_gradient(dmu[:, :, 0])
 
     def predict(self, x, **kwargs):
         """
@@ -65,8 +120,8 @@ class GPEmulator(Emulator):
         """
         assert hasattr(self, "_gp"), "Must first fit GP to data"
 
-        if self._input_scaler:
-            x = self._input_scaler.transform(x)
+        self._sync_gp()
+        x = self._transform_input(x)
 
         # don't apply output scaler to preserve variance values properly
         return self._gp.predict_noiseless(x, **kwargs)
@@ -75,8 +130,17 @@ class GPEmulator(Emulator):
             self,
             model=None,
             kernel=None,
-            optimizer=None):
-
+            optimizer=None,
+            n_inducing=None,
+            inducing_method=None):
+        """
+        Sets GPy model class, kernel and optimizer used for fitting.
+        Giving ``n_inducing`` selects a sparse GP
+        (``GPy.models.SparseGPRegression`` unless another sparse model is
+        given) with that many inducing points, chosen from training inputs by
+        ``inducing_method``: "kmeans" (default), "variance" or "random".
+        See :func:`utils.select_inducing_points`.
+        """
         if model:
             self._model = model
 
@@ -86,6 +150,37 @@ class GPEmulator(Emulator):
         if optimizer:
             self._optimizer = optimizer
 
+        if n_inducing:
+            self._n_inducing = n_inducing
+            if not self.is_sparse():
+                import GPy
+                self._model = GPy.models.SparseGPRegression
+
+        if inducing_method:
+            self._inducing_method = inducing_method
+
+    def search_kernel(self, **kwargs):
+        """
+        Searches for a composite kernel on the (scaled) training data with
+        :func:`kernels.kernel_search`, which accepts **kwargs, and sets the
+        best kernel found as the kernel used by fit().
+        Returns the list of search results, best first.
+        """
+        from . import kernels as emukernels
+
+        results = emukernels.kernel_search(self._X, self._y, **kwargs)
+        if results and results[0]["kernel"] is not None:
+            self.set_parameters(kernel=results[0]["kernel"].copy())
+        return results
+
+    def is_sparse(self):
+        """
+        True when the model used is an inducing point (sparse) GP.
+        """
+        import GPy
+
+        return issubclass(self._model, GPy.core.SparseGP)
+
     def fit(self, optimize=True, messages=True, **kwargs):
         """
         Creates a GP for the provided data.
@@ -93,23 +188,328 @@ class GPEmulator(Emulator):
         e.g. normalizer = True normalizes the outputs.
         By default optimizes the GP, however this can be turned off to provide
         additional arguments for GPy optimizer.
+        For sparse models inducing inputs are selected from the training data
+        unless ``Z`` is given in **kwargs.
         """
+        if self.is_sparse() and 'Z' not in kwargs:
+            kwargs['Z'] = emutils.select_inducing_points(
+                self._X,
+                getattr(self, '_n_inducing', 10),
+                method=getattr(self, '_inducing_method', 'kmeans'),
+                kernel=getattr(self, '_kernel', None),
+            )
+
+        start = time.time()
         if hasattr(self, '_kernel'):
             self._gp = self._model(self._X, self._y, self._kernel, **kwargs)
         else:
             self._gp = self._model(self._X, self._y, **kwargs)
 
+        # needed to rebuild the model of a saved emulator
+        self._fit_kwargs = kwargs
+
         if optimize:
             self.optimize(messages=messages)
+        else:
+            self.compile_predictor()
+
+        if self._profiler is not None:
+            self._profiler.record_event(
+                "fit", time.time() - start, n_points=len(self._X))
 
     def optimize(self, messages=True, **kwargs):
         """
         Optimize GP to data. **kwargs are the parameters for the GPy optimizer.
         """
-        if hasattr(self, '_optimizer'):
-            self._gp.optimize(self._optimizer, messages=messages, **kwargs)
+        self._sync_gp()
+        profiler = self._profiler
+        if profiler is not None:
+            # time every evaluation of the objective and its gradient
+            objective = self._gp._objective_grads
+
+            def timed_objective(x):
+                with profiler.stage("optimize_iteration"):
+                    return objective(x)
+            self._gp._objective_grads = timed_objective
+            start = time.time()
+
+        try:
+            if hasattr(self, '_optimizer'):
+                self._gp.optimize(
+                    self._optimizer, messages=messages, **kwargs)
+            else:
+                self._gp.optimize(messages=messages, **kwargs)
+        finally:
+            if profiler is not None:
+                del self._gp._objective_grads
+
+        if profiler is not None:
+            run = self._gp.optimization_runs[-1]
+            profiler.record_event(
+                "optimize",
+                time.time() - start,
+                optimizer=getattr(run, "opt_name", None),
+                n_evaluations=getattr(run, "funct_eval", None),
+                log_marginal_likelihood=float(
+                    self._gp.log_likelihood()),
+            )
+
+        self.compile_predictor()
+
+    def optimize_restarts(self, n_restarts=10, n_jobs=None, seed=None,
+                          **kwargs):
+        """
+        Optimizes the GP ``n_restarts`` times in a pool of ``n_jobs``
+        processes (all cores by default) and keeps the hyperparameters with
+        the highest log marginal likelihood. The first restart starts from
+        the current hyperparameters, the others from random ones.
+        **kwargs are the parameters for the GPy optimizer.
+
+        Statistics of every restart are available through
+        :meth:`get_restart_history`. Returns the best log marginal
+        likelihood.
+        """
+        assert hasattr(self, "_gp"), "Must first fit GP"
+
+        self._sync_gp()
+
+        # every restart gets its own seed, forked workers would otherwise
+        # share the state of the global random number generator
+        if seed is None:
+            seeds = np.random.randint(2 ** 31 - 1, size=n_restarts)
         else:
-            self._gp.optimize(messages=messages, **kwargs)
+            seeds = seed + np.arange(n_restarts)
+
+        tasks = [(
+            self._gp,
+            getattr(self, '_optimizer', None),
+            restart,
+            int(seeds[restart]),
+            kwargs,
+        ) for restart in range(n_restarts)]
+
+        if n_jobs == 1 or n_restarts == 1:
+            # restarts work on copies, as workers do, so the model is left
+            # unchanged if all of them fail
+            results = [_optimize_restart((task[0].copy(), ) + task[1:])
+                       for task in tasks]
+        else:
+            pool = multiprocessing.Pool(n_jobs)
+            try:
+                results = pool.map(_optimize_restart, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        self._restarts = results
+        if self._profiler is not None:
+            for r in results:
+                self._profiler.record_event(
+                    "optimize_restart",
+                    r['time'],
+                    restart=r['restart'],
+                    log_marginal_likelihood=r['log_marginal_likelihood'],
+                )
+        best = max(results, key=lambda r: r['log_marginal_likelihood'])
+        if best['parameters'] is None:
+            raise RuntimeError("All optimizer restarts failed")
+
+        self._gp[:] = best['parameters']
+        self.compile_predictor()
+
+        return self.get_log_marginal_likelihood()
+
+    def get_restart_history(self):
+        """
+        Returns a list with a dictionary for each restart of the last
+        optimize_restarts() call, containing the restart index, the log
+        marginal likelihood reached, the optimized hyperparameters and the
+        wall-clock time taken by the restart in seconds.
+        """
+        assert hasattr(self, "_restarts"), "Must first run optimize_restarts"
+
+        return self._restarts
+
+    def compile_predictor(self):
+        """
+        Caches posterior weights and kernel hyperparameters of the trained GP
+        so that predictive means are computed with NumPy only, skipping GPy.
+        Called automatically by fit() and optimize(), call it manually after
+        changing the GPy model directly.
+        Returns False if the kernel is not supported, in which case
+        predictions fall back to GPy.
+        """
+        assert hasattr(self, "_gp"), "Must first fit GP"
+
+        self._sync_gp()
+        self._predictor = compile_mean_predictor(self._gp)
+        self._chol = None
+        self._changed()
+        return self._predictor is not None
+
+    def add_data(self, X, y, reoptimize=False):
+        """
+        Adds training points to a fitted emulator without refitting it from
+        scratch. Existing input and output scalers are applied to the new
+        data (they are not refitted).
+
+        For an exact GP regression the Cholesky factor of the kernel matrix
+        is extended with a rank-k update, so adding k points to N costs
+        O(N^2 k) instead of O(N^3). Hyperparameters are kept unless
+        ``reoptimize`` is True. Other models are updated through GPy.
+
+        Arguments:
+
+        ``X``
+            k by n_parameters matrix of new inputs.
+        ``y``
+            k target values for the new inputs.
+        ``reoptimize``
+            (Optional) If True hyperparameters are optimized after adding.
+        """
+        X = self._as_batch(X)
+        y = np.asarray(y, dtype=float).reshape((len(X), 1))
+        X = self._transform_input(X)
+        y = self._transform_output(y)
+
+        X_old = self._X
+        self._X = np.vstack([self._X, X])
+        self._y = np.vstack([self._y, y])
+        self._changed()
+
+        if not hasattr(self, "_gp"):
+            return
+
+        if reoptimize or not self._update_posterior(X_old, X):
+            self._gp.set_XY(self._X, self._y)
+            self._gp_stale = False
+            if reoptimize:
+                self.optimize(messages=False)
+            else:
+                self.compile_predictor()
+
+    def _update_posterior(self, X_old, X_new):
+        """
+        Extends Cholesky factor and posterior weights with new inputs.
+        Returns False if the model doesn't allow for a rank-k update.
+        """
+        gp = self._gp
+        if self._predictor is None or not self._is_exact():
+            return False
+
+        L = self._chol
+        if L is None:
+            L = gp.posterior.woodbury_chol
+
+        # same jitter as GPy's exact inference
+        noise = float(np.asarray(gp.likelihood.variance)[0]) + 1e-8
+        K_cross = gp.kern.K(X_old, X_new)
+        K_new = gp.kern.K(X_new) + noise * np.eye(len(X_new))
+
+        S = solve_triangular(L, K_cross, lower=True)
+        try:
+            L_new = cholesky(K_new - np.dot(S.T, S), lower=True)
+        except np.linalg.LinAlgError:
+            return False
+
+        n, k = len(X_old), len(X_new)
+        chol = np.zeros((n + k, n + k))
+        chol[:n, :n] = L
+        chol[n:, :n] = S.T
+        chol[n:, n:] = L_new
+
+        alpha = cho_solve((chol, True), self._y)
+        self._chol = chol
+        self._predictor = compile_mean_predictor(gp, X=self._X, alpha=alpha)
+        self._changed()
+        self._gp_stale = True
+        return True
+
+    def _is_exact(self):
+        """
+        True for an exact GP regression without normalizer or mean function,
+        whose posterior weights are ``K^-1 y`` for the training data.
+        """
+        import GPy
+
+        gp = self._gp
+        inference = GPy.inference.latent_function_inference
+        return (type(gp) is GPy.models.GPRegression and
+                gp.normalizer is None and
+                gp.mean_function is None and
+                isinstance(gp.inference_method,
+                           inference.ExactGaussianInference))
+
+    def _sync_gp(self):
+        """
+        Passes data added by add_data() to the GPy model.
+        """
+        if self._gp_stale:
+            self._gp.set_XY(self._X, self._y)
+            self._gp_stale = False
+
+    def _save_state(self, path):
+        """
+        GPy objects are pickled separately from the NumPy predictor and the
+        Cholesky factor, so that loading doesn't need GPy.
+        """
+        gpy_state = {}
+        for name in ("_model", "_kernel", "_optimizer", "_fit_kwargs"):
+            if hasattr(self, name):
+                gpy_state[name] = getattr(self, name)
+
+        chol = None
+        if hasattr(self, "_gp"):
+            self._sync_gp()
+            # kernel is copied to unlink it from the model and its data
+            gpy_state["kernel"] = self._gp.kern.copy()
+            gpy_state["parameters"] = self._gp.param_array.copy()
+
+            chol = self._chol
+            if chol is None and self._is_exact():
+                chol = self._gp.posterior.woodbury_chol
+            if chol is not None:
+                np.save(os.path.join(path, "chol.npy"), chol)
+
+        state = {
+            "gpy_state": pickle.dumps(gpy_state,
+                                      protocol=pickle.HIGHEST_PROTOCOL),
+            "predictor": self._predictor,
+            "has_chol": chol is not None,
+        }
+        for name in ("_n_inducing", "_inducing_method", "_restarts"):
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def _load_state(self, path, state, mmap_mode):
+        self._gp_pickle = state["gpy_state"]
+        self._predictor = state["predictor"]
+        self._chol = None
+        if state["has_chol"]:
+            self._chol = np.load(os.path.join(path, "chol.npy"),
+                                 mmap_mode=mmap_mode)
+        self._gp_stale = False
+
+        for name in ("_n_inducing", "_inducing_method", "_restarts"):
+            if name in state:
+                setattr(self, name, state[name])
+
+    def _restore_gp(self):
+        """
+        Unpickles settings and rebuilds the GPy model of a loaded emulator
+        with the saved hyperparameters, without optimizing it.
+        """
+        gpy_state = pickle.loads(self.__dict__.pop("_gp_pickle"))
+        for name in ("_model", "_kernel", "_optimizer", "_fit_kwargs"):
+            if name in gpy_state:
+                setattr(self, name, gpy_state[name])
+
+        if "kernel" in gpy_state:
+            gp = self._model(self._X, self._y, gpy_state["kernel"],
+                             **getattr(self, "_fit_kwargs", {}))
+            gp[:] = gpy_state["parameters"]
+            self._gp = gp
 
     def summary(self):
         print("Summary")
@@ -117,18 +517,36 @@ class GPEmulator(Emulator):
               self._kernel if hasattr(self, '_kernel') else "default")
         print("Model: ",
               self._model if hasattr(self, '_model') else "default")
+        if self.is_sparse():
+            print("Inducing points: ", getattr(self, '_n_inducing', 10))
         print("Optimizer: ",
               str(self._optimizer) if hasattr(self, '_optimizer')
               else "default")
+        if hasattr(self, "_gp"):
+            self._sync_gp()
         print(self._gp if hasattr(self, "_gp") else "No fit performed")
 
-    def get_gp(self):
+    def get_gp(self, copy=True):
         """
-        Returns a copy of GPy model
+        Returns a copy of GPy model.
+
+        With ``copy=False`` the model used by the emulator is returned
+        instead, which avoids duplicating its kernel matrices. This is a
+        mutable internal handle, and the emulator is not notified of
+        changes made through it (e.g. new hyperparameters, data or
+        optimization): predictions keep using the NumPy predictor compiled
+        from the old state, and values memoised from the emulator, e.g. by
+        :class:`CachedEmulator` or the plotting functions, are not
+        discarded. Treat it as read-only, or call :meth:`compile_predictor`
+        after changing it, which updates predictions and invalidates
+        memoised values.
         """
         assert hasattr(self, "_gp"), "Must first fit GP"
 
-        return copy.deepcopy(self._gp)
+        self._sync_gp()
+        if not copy:
+            return self._gp
+        return _copy.deepcopy(self._gp)
 
     def get_trained_kern(self):
         """
@@ -144,4 +562,38 @@ class GPEmulator(Emulator):
         """
         assert hasattr(self, "_gp"), "Must first fit GP"
 
+        self._sync_gp()
         return self._gp.log_likelihood()
+
+
+# Attributes holding GPy objects, restored lazily after load()
+_GPY_STATE = ("_gp", "_model", "_kernel", "_optimizer", "_fit_kwargs")
+
+
+def _optimize_restart(task):
+    """
+    Runs a single optimizer restart on a copy of a GPy model, used in
+    worker processes.
+    """
+    gp, optimizer, restart, seed, kwargs = task
+    start = time.time()
+    if restart > 0:
+        gp.randomize(rand_gen=np.random.RandomState(seed).normal)
+
+    try:
+        if optimizer is not None:
+            gp.optimize(optimizer, messages=False, **kwargs)
+        else:
+            gp.optimize(messages=False, **kwargs)
+        log_marginal_likelihood = float(gp.log_likelihood())
+        parameters = gp.param_array.copy()
+    except np.linalg.LinAlgError:
+        log_marginal_likelihood = -np.inf
+        parameters = None
+
+    return {
+        'restart': restart,
+        'log_marginal_likelihood': log_marginal_likelihood,
+        'parameters': parameters,
+        'time': time.time() - start,
+    }
@@ -0,0 +1,306 @@
+#
+# Pure NumPy predictive mean of a trained GPy model.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import affine_map
+import numpy as np
+
+
+class GPMeanPredictor(object):
+    """
+    Predictive mean of a trained GP that bypasses GPy at inference time.
+
+    The posterior weights ``alpha = K^-1 y``, the training (or inducing)
+    inputs and the kernel hyperparameters are copied out of the GPy model,
+    so a prediction is a single cross-kernel product ``K(x, X) alpha``
+    without any of the variance related work done by GPy.
+    The predictor is a snapshot: it has to be rebuilt whenever the
+    hyperparameters or training data of the GP change.
+
+    Use :func:`compile_mean_predictor` to create an instance.
+
+    Arguments:
+
+    ``kernel``
+        Compiled kernel, evaluates covariance between new and training inputs.
+    ``alpha``
+        N by n_outputs posterior weights.
+    ``normalizer``
+        (Optional) Affine normalizer used by the model.
+    """
+
+    def __init__(self, kernel, alpha, normalizer=None):
+        self._kernel = kernel
+        self._alpha = alpha
+        self._normalizer = normalizer
+
+    def __call__(self, X):
+        """
+        Returns predictive mean (N by n_outputs) for N by n_parameters inputs.
+        """
+        mu = np.dot(self._kernel.cross(X), self._alpha)
+        if self._normalizer is not None:
+            mu = self._normalizer.inverse_mean(mu)
+        return mu
+
+    def gradient(self, X):
+        """
+        Returns predictive mean (N by n_outputs) and its gradient with
+        respect to the inputs (N by n_parameters by n_outputs).
+        """
+        K, dK = self._kernel.gradient(X)
+        mu = np.dot(K, self._alpha)
+        dmu = np.einsum("mnd,no->mdo", dK, self._alpha)
+        if self._normalizer is not None:
+            mu = self._normalizer.inverse_mean(mu)
+            dmu = dmu * self._normalizer._scale
+        return mu, dmu
+
+
+class UnsupportedKernelError(Exception):
+    """
+    Raised when a GPy kernel can not be compiled to NumPy.
+    """
+
+
+def compile_mean_predictor(gp, X=None, alpha=None):
+    """
+    Returns a :class:`GPMeanPredictor` for a trained GPy model or ``None`` if
+    the model uses kernels or mean functions that are not supported,
+    in which case GPy should be used for predictions.
+
+    Supported kernels are RBF, Exponential, Matern32, Matern52, Linear, Bias
+    and White, as well as any sums and products of them. Output normalizers
+    must be affine maps, such as GPy's Standardize.
+
+    Training inputs ``X`` and posterior weights ``alpha`` are taken from the
+    model unless given, e.g. after the posterior was updated with new data.
+    """
+    if getattr(gp, "mean_function", None) is not None:
+        return None
+
+    try:
+        if X is None:
+            X = gp._predictive_variable
+        if alpha is None:
+            alpha = gp.posterior.woodbury_vector
+        X = np.asarray(X)
+        alpha = np.array(alpha)
+        kernel = _compile_kernel(gp.kern, X)
+    except (UnsupportedKernelError, AttributeError):
+        return None
+
+    normalizer = getattr(gp, "normalizer", None)
+    if normalizer is not None:
+        # plain arrays instead of the GPy normalizer, so that the predictor
+        # can be pickled and loaded without GPy
+        affine = affine_map(normalizer.inverse_mean, alpha.shape[1])
+        if affine is None:
+            return None
+        normalizer = _AffineNormalizer(*affine)
+
+    return GPMeanPredictor(kernel, alpha, normalizer)
+
+
+class _AffineNormalizer(object):
+    def __init__(self, scale, offset):
+        self._scale = scale
+        self._offset = offset
+
+    def inverse_mean(self, mu):
+        return mu * self._scale + self._offset
+
+
+def _compile_kernel(kern, X):
+    """
+    Converts GPy kernel into an equivalent NumPy kernel bound to the
+    training inputs ``X``. Compiled kernels have methods ``cross(Xnew)``,
+    returning the M by N covariance with training inputs, and
+    ``gradient(Xnew)``, returning the covariance together with its
+    M by N by n_parameters derivative with respect to ``Xnew``.
+    """
+    from GPy import kern as gpy_kern
+
+    kern_type = type(kern)
+    if kern_type == gpy_kern.src.add.Add:
+        return _Add([_compile_kernel(k, X) for k in kern.parts])
+    if kern_type == gpy_kern.src.prod.Prod:
+        return _Prod([_compile_kernel(k, X) for k in kern.parts])
+
+    stationary = {
+        gpy_kern.RBF: (_rbf, _rbf_dr),
+        gpy_kern.Exponential: (_exponential, _exponential_dr),
+        gpy_kern.Matern32: (_matern32, _matern32_dr),
+        gpy_kern.Matern52: (_matern52, _matern52_dr),
+    }
+    if kern_type in stationary:
+        return _Stationary(kern, X, *stationary[kern_type])
+    if kern_type == gpy_kern.Linear:
+        return _Linear(kern, X)
+    if kern_type == gpy_kern.Bias:
+        return _Bias(kern, X)
+    if kern_type == gpy_kern.White:
+        return _White(kern, X)
+
+    raise UnsupportedKernelError(
+        "Can't compile kernel of type " + kern_type.__name__)
+
+
+# Covariance as a function of scaled distance for stationary kernels, and
+# its derivative divided by r (finite at r = 0, except for Exponential)
+def _rbf(r):
+    return np.exp(-0.5 * r ** 2)
+
+
+def _rbf_dr(r):
+    return -np.exp(-0.5 * r ** 2)
+
+
+def _exponential(r):
+    return np.exp(-r)
+
+
+def _exponential_dr(r):
+    # not differentiable at r = 0, use 0 there as GPy does
+    with np.errstate(divide="ignore"):
+        return np.where(r > 0, -np.exp(-r) / r, 0.)
+
+
+def _matern32(r):
+    sqrt3_r = np.sqrt(3.) * r
+    return (1. + sqrt3_r) * np.exp(-sqrt3_r)
+
+
+def _matern32_dr(r):
+    return -3. * np.exp(-np.sqrt(3.) * r)
+
+
+def _matern52(r):
+    sqrt5_r = np.sqrt(5.) * r
+    return (1. + sqrt5_r + 5. / 3. * r ** 2) * np.exp(-sqrt5_r)
+
+
+def _matern52_dr(r):
+    sqrt5_r = np.sqrt(5.) * r
+    return -5. / 3. * (1. + sqrt5_r) * np.exp(-sqrt5_r)
+
+
+class _Stationary(object):
+    """
+    Stationary kernel ``variance * k(r)``, r being the distance scaled by
+    (possibly ARD) lengthscales.
+    """
+
+    def __init__(self, kern, X, k_of_r, dk_of_r):
+        self._dims = np.asarray(kern._all_dims_active)
+        self._variance = float(np.asarray(kern.variance)[0])
+        self._lengthscale = np.array(kern.lengthscale, dtype=float)
+        self._k_of_r = k_of_r
+        self._dk_of_r = dk_of_r
+
+        # everything depending only on training inputs is computed once
+        self._X = X[:, self._dims] / self._lengthscale
+        self._X_sq = np.sum(self._X ** 2, axis=1)
+
+    def _scaled_dist(self, Xnew):
+        Xnew = Xnew[:, self._dims] / self._lengthscale
+        r2 = (np.sum(Xnew ** 2, axis=1)[:, None] + self._X_sq[None, :]
+              - 2. * np.dot(Xnew, self._X.T))
+        return np.sqrt(np.clip(r2, 0, np.inf))
+
+    def cross(self, Xnew):
+        return self._variance * self._k_of_r(self._scaled_dist(Xnew))
+
+    def gradient(self, Xnew):
+        r = self._scaled_dist(Xnew)
+        K = self._variance * self._k_of_r(r)
+
+        # dk/dx = k'(r) / r * (x - X) / lengthscale^2
+        diff = (Xnew[:, None, self._dims] / self._lengthscale
+                - self._X[None, :, :])
+        dK = np.zeros((len(Xnew), len(self._X), Xnew.shape[1]))
+        dK[:, :, self._dims] = (self._variance * self._dk_of_r(r)[:, :, None]
+                                * diff / self._lengthscale)
+        return K, dK
+
+
+class _Linear(object):
+    def __init__(self, kern, X):
+        self._dims = np.asarray(kern._all_dims_active)
+        self._X = X[:, self._dims] * np.array(kern.variances, dtype=float)
+
+    def cross(self, Xnew):
+        return np.dot(Xnew[:, self._dims], self._X.T)
+
+    def gradient(self, Xnew):
+        dK = np.zeros((len(Xnew), len(self._X), Xnew.shape[1]))
+        dK[:, :, self._dims] = self._X[None, :, :]
+        return self.cross(Xnew), dK
+
+
+class _Bias(object):
+    def __init__(self, kern, X):
+        self._variance = float(np.asarray(kern.variance)[0])
+        self._n = len(X)
+
+    def cross(self, Xnew):
+        return np.full((len(Xnew), self._n), self._variance)
+
+    def gradient(self, Xnew):
+        return (self.cross(Xnew),
+                np.zeros((len(Xnew), self._n, Xnew.shape[1])))
+
+
+class _White(object):
+    # white noise does not correlate distinct inputs
+    def __init__(self, kern, X):
+        self._n = len(X)
+
+    def cross(self, Xnew):
+        return np.zeros((len(Xnew), self._n))
+
+    def gradient(self, Xnew):
+        return (self.cross(Xnew),
+                np.zeros((len(Xnew), self._n, Xnew.shape[1])))
+
+
+class _Add(object):
+    def __init__(self, parts):
+        self._parts = parts
+
+    def cross(self, Xnew):
+        K = self._parts[0].cross(Xnew)
+        for part in self._parts[1:]:
+            K = K + part.cross(Xnew)
+        return K
+
+    def gradient(self, Xnew):
+        K, dK = self._parts[0].gradient(Xnew)
+        for part in self._parts[1:]:
+            K_part, dK_part = part.gradient(Xnew)
+            K = K + K_part
+            dK = dK + dK_part
+        return K, dK
+
+
+class _Prod(object):
+    def __init__(self, parts):
+        self._parts = parts
+
+    def cross(self, Xnew):
+        K = self._parts[0].cross(Xnew)
+        for part in self._parts[1:]:
+            K = K * part.cross(Xnew)
+        return K
+
+    def gradient(self, Xnew):
+        # product rule, d(K1 K2) = dK1 K2 + K1 dK2
+        K, dK = self._parts[0].gradient(Xnew)
+        for part in self._parts[1:]:
+            K_part, dK_part = part.gradient(Xnew)
+            dK = dK * K_part[:, :, None] + K[:, :, None] * dK_part
+            K = K * K_part
+        return K, dK
@@ -0,0 +1,311 @@
+#
+# Emulator combining independent GPs fitted on regions of parameter space.
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import Emulator
+from ._gp_predictor import compile_mean_predictor
+import multiprocessing
+import numpy as np
+import copy
+import time
+import GPy
+
+
+class LocalGPEmulator(Emulator):
+    """
+    *Extends:* :class:`Emulator`
+
+    Emulator made of local GP experts. The parameter box is split into a
+    KD-tree of regions, each holding at most ``max_points`` training points,
+    and an independent GP is fitted on every region. Experts are fitted in
+    parallel processes, so the cost of training grows linearly with N and
+    uses all available cores.
+
+    Predictions of experts are combined with one of:
+
+    - "nearest": mean of the expert whose region contains the input.
+      Fastest, but the surface can be discontinuous on region boundaries.
+    - "poe": product of experts, every expert is weighted by its precision.
+    - "gpoe": generalized product of experts, precisions are additionally
+      weighted by the reduction in entropy from prior to posterior, so that
+      experts far from their data have little influence.
+
+    Arguments:
+
+    ``log_likelihood``
+        A :class:`LogPDF`, the likelihood distribution being emulated.
+    ``X``
+        N by n_parameters matrix containing inputs for training data
+    ``y``
+        N by 1, target values for each input vector
+    ``bounds``
+        (Optional) :class:`pints.RectangularBoundaries` of the parameter
+        space, e.g. ``bounds`` of :meth:`Problems.load_problem`. By default
+        the bounding box of the training data is used.
+    ``max_points``
+        (Optional) Maximum number of training points in a region.
+    """
+
+    def __init__(self, log_likelihood, X, y, bounds=None, max_points=500,
+                 **kwargs):
+        super(LocalGPEmulator, self).__init__(log_likelihood, X, y, **kwargs)
+
+        if bounds is not None:
+            box = np.vstack([bounds.lower(), bounds.upper()])
+            box = self._transform_input(box)
+            self._lower = np.min(box, axis=0)
+            self._upper = np.max(box, axis=0)
+        else:
+            self._lower = np.min(self._X, axis=0)
+            self._upper = np.max(self._X, axis=0)
+
+        self._max_points = max_points
+        self._combine = "nearest"
+        self.set_parameters(model=GPy.models.GPRegression)
+
+    def predict(self, x):
+        """
+        Returns mean, var of the combined experts for given input parameters.
+        As in :meth:`GPEmulator.predict` output scaler is not applied.
+        """
+        assert hasattr(self, "_experts"), "Must first fit GPs to data"
+
+        x = self._transform_input(self._as_batch(x))
+        if self._combine == "nearest":
+            mean = np.zeros((len(x), 1))
+            var = np.zeros((len(x), 1))
+            leaves = self._locate(x)
+            for leaf in np.unique(leaves):
+                rows = leaves == leaf
+                mean[rows], var[rows] = \
+                    self._experts[leaf].predict_noiseless(x[rows])
+            return mean, var
+
+        return self._product_of_experts(x)
+
+    def _predict_scaled(self, X):
+        assert hasattr(self, "_experts"), "Must first fit GPs to data"
+
+        if self._combine != "nearest":
+            return self._product_of_experts(X)[0]
+
+        profiler = self._profiler
+        if profiler is None:
+            leaves = self._locate(X)
+        else:
+            # part of the predict_experts stage
+            with profiler.stage("locate", len(X)):
+                leaves = self._locate(X)
+
+        y = np.zeros((len(X), 1))
+        for leaf in np.unique(leaves):
+            rows = leaves == leaf
+            y[rows] = self._expert_mean(leaf, X[rows])
+        return y
+
+    def _predict_stage(self):
+        return "predict_experts"
+
+    def _expert_mean(self, leaf, X):
+        if self._predictors[leaf] is not None:
+            return self._predictors[leaf](X)
+        return self._experts[leaf].predict_noiseless(X)[0]
+
+    def _product_of_experts(self, X):
+        """
+        Combines predictions of all experts, X is already transformed.
+        """
+        precision = np.zeros((len(X), 1))
+        weighted_mean = np.zeros((len(X), 1))
+        for expert in self._experts:
+            mean, var = expert.predict_noiseless(X)
+            var = np.clip(var, 1e-12, np.inf)
+            if self._combine == "gpoe":
+                prior_var = expert.kern.Kdiag(X).reshape(var.shape)
+                beta = 0.5 * (np.log(prior_var) - np.log(var))
+            else:
+                beta = 1.
+            precision += beta / var
+            weighted_mean += beta * mean / var
+
+        precision = np.clip(precision, 1e-12, np.inf)
+        return weighted_mean / precision, 1. / precision
+
+    def set_parameters(
+            self,
+            model=None,
+            kernel=None,
+            optimizer=None,
+            combine=None):
+        """
+        Sets GPy model class, kernel (copied for every expert) and optimizer
+        used for fitting experts, as well as the method used to combine
+        their predictions: "nearest", "poe" or "gpoe".
+        """
+        if model:
+            self._model = model
+
+        if kernel:
+            self._kernel = kernel
+
+        if optimizer:
+            self._optimizer = optimizer
+
+        if combine:
+            if combine not in ("nearest", "poe", "gpoe"):
+                raise ValueError("Unknown combination method: " + combine)
+            self._combine = combine
+
+    def fit(self, optimize=True, n_workers=None, messages=False, **kwargs):
+        """
+        Partitions the parameter space and fits a GP in every region.
+        Experts are fitted in a pool of ``n_workers`` processes, all
+        available cores by default; ``n_workers=1`` fits serially.
+        **kwargs are passed to the GPy model instances.
+        """
+        start = time.time()
+        self._build_tree()
+
+        tasks = []
+        for idx in self._leaf_points:
+            tasks.append((
+                self._model,
+                self._X[idx],
+                self._y[idx],
+                copy.deepcopy(getattr(self, '_kernel', None)),
+                getattr(self, '_optimizer', None),
+                optimize,
+                messages,
+                kwargs,
+            ))
+
+        if n_workers == 1 or len(tasks) == 1:
+            self._experts = [_fit_expert(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(n_workers)
+            try:
+                self._experts = pool.map(_fit_expert, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        self._predictors = [compile_mean_predictor(gp)
+                            for gp in self._experts]
+        self._changed()
+
+        if self._profiler is not None:
+            self._profiler.record_event(
+                "fit",
+                time.time() - start,
+                n_points=len(self._X),
+                n_experts=len(self._experts),
+            )
+
+    def _build_tree(self):
+        """
+        Builds KD-tree by recursively splitting regions at the median of
+        their widest dimension until they have at most max_points points.
+        Tree is stored as flat arrays, leaves have split dimension -1.
+        """
+        self._split_dim = []
+        self._split_value = []
+        self._children = []
+        self._leaf_index = []
+        self._leaf_points = []
+
+        def split(idx, lower, upper):
+            node = len(self._split_dim)
+            self._split_dim.append(-1)
+            self._split_value.append(0.)
+            self._children.append((-1, -1))
+            self._leaf_index.append(-1)
+
+            if len(idx) <= self._max_points:
+                self._leaf_index[node] = len(self._leaf_points)
+                self._leaf_points.append(idx)
+                return node
+
+            dim = int(np.argmax(upper - lower))
+            value = np.median(self._X[idx, dim])
+            left = idx[self._X[idx, dim] <= value]
+            right = idx[self._X[idx, dim] > value]
+            if len(left) == 0 or len(right) == 0:
+                # can't split repeated values any further
+                self._leaf_index[node] = len(self._leaf_points)
+                self._leaf_points.append(idx)
+                return node
+
+            left_upper = upper.copy()
+            left_upper[dim] = value
+            right_lower = lower.copy()
+            right_lower[dim] = value
+
+            self._split_dim[node] = dim
+            self._split_value[node] = value
+            self._children[node] = (
+                split(left, lower, left_upper),
+                split(right, right_lower, upper),
+            )
+            return node
+
+        split(np.arange(len(self._X)), self._lower.copy(), self._upper.copy())
+
+        self._split_dim = np.array(self._split_dim)
+        self._split_value = np.array(self._split_value)
+        self._children = np.array(self._children)
+        self._leaf_index = np.array(self._leaf_index)
+
+    def _locate(self, X):
+        """
+        Returns index of the region containing each row of (transformed) X.
+        Points outside the box are assigned to the closest region.
+        """
+        nodes = np.zeros(len(X), dtype=int)
+        internal = self._split_dim[nodes] >= 0
+        while np.any(internal):
+            rows = np.where(internal)[0]
+            current = nodes[rows]
+            dims = self._split_dim[current]
+            go_right = X[rows, dims] > self._split_value[current]
+            nodes[rows] = self._children[current, go_right.astype(int)]
+            internal = self._split_dim[nodes] >= 0
+
+        return self._leaf_index[nodes]
+
+    def n_experts(self):
+        """
+        Returns the number of local GPs.
+        """
+        assert hasattr(self, "_experts"), "Must first fit GPs to data"
+
+        return len(self._experts)
+
+    def get_experts(self):
+        """
+        Returns list of GPy models, one for each region.
+        """
+        assert hasattr(self, "_experts"), "Must first fit GPs to data"
+
+        return self._experts
+
+
+def _fit_expert(task):
+    """
+    Creates and optimizes a single GPy model, runs in worker processes.
+    """
+    model, X, y, kernel, optimizer, optimize, messages, kwargs = task
+    if kernel is not None:
+        gp = model(X, y, kernel, **kwargs)
+    else:
+        gp = model(X, y, **kwargs)
+
+    if optimize:
+        if optimizer is not None:
+            gp.optimize(optimizer, messages=messages)
+        else:
+            gp.optimize(messages=messages)
+
+    return gp
@@ -6,13 +6,13 @@ from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
 from ._emulator import Emulator
-from .models import create_model
+from ._dense import DenseNetwork
+from ._numpy_emulator import NumpyEmulator
 import warnings
 import numpy as np
 import copy
-
-import tensorflow as tf
-from tensorflow import keras
+import time
+import os
 
 
 class NNEmulator(Emulator):
@@ -35,33 +35,151 @@ class NNEmulator(Emulator):
         N by 1, target values for each input vector
     ``normalize_input``
         If true then inputs will be normalized
+
+    A trained emulator can be written to disk with :meth:`save` and restored
+    with :meth:`load`. Restored emulators predict with NumPy straight away;
+    TensorFlow is only imported once the Keras model is needed.
     """
 
     def __init__(self, log_likelihood, X, y, model_size='average', **kwargs):
         super(NNEmulator, self).__init__(log_likelihood, X, y, **kwargs)
+        from .models import create_model
 
         # default model is Regression
+        self._model_size = model_size
         self._model = create_model(log_likelihood._n_parameters, model_size)
 
-    def __call__(self, x):
+        # NumPy copy of the network used for inference
+        self.compile_predictor()
+
+    def __getattr__(self, name):
+        # Keras model of an emulator restored by load() is rebuilt on first
+        # access only
+        if name == "_model" and "_model_weights" in self.__dict__:
+            self._restore_model()
+            return self._model
+        raise AttributeError(name)
+
+    def evaluateS1_batch(self, X):
+        """
+        Returns the emulated log-likelihood (an array of length N) and its
+        gradients (N by n_parameters) for every row of ``X``. Gradients are
+        backpropagated through the NumPy network, or through the Keras model
+        with TensorFlow's automatic differentiation.
+        """
+        X = self._as_batch(X)
+        Z = self._transform_input(X)
+        if self._network is not None:
+            y, dy = self._network.gradient(Z)
+            dy = dy[:, :, 0]
+        else:
+            import tensorflow as tf
+
+            Z = tf.convert_to_tensor(Z, dtype=tf.float32)
+            with tf.GradientTape() as tape:
+                tape.watch(Z)
+                y = self._model(Z, training=False)
+            dy = tape.gradient(y, Z).numpy().astype(float)
+            y = y.numpy().astype(float)
+
+        y = self._inverse_transform_output(y).reshape(len(X))
+        return y, self._inverse_transform_gradient(dy)
+
+    def _predict_scaled(self, X):
+        """
+        Forward pass for an N by n_parameters matrix of scaled inputs.
+        Keras' predict() is avoided, as its batching machinery costs
+        milliseconds per call.
+        """
+        if self._network is not None:
+            return self._network(X)
+        return np.asarray(self._model(X, training=False))
+
+    def _predict_stage(self):
+        if self._network is not None:
+            return "predict_numpy"
+        return "predict_keras"
+
+    def compile_predictor(self):
+        """
+        Copies weights of the Keras model to a NumPy network used for
+        inference. Called automatically by fit(), call it manually after
+        changing the Keras model directly. Returns False if the model has
+        layers that are not supported, in which case the Keras model is
+        called directly.
+        """
+        try:
+            self._network = DenseNetwork.from_keras(self._model)
+        except ValueError:
+            self._network = None
+        self._changed()
+        return self._network is not None
+
+    def to_numpy(self):
+        """
+        Returns a :class:`NumpyEmulator` with a copy of the trained network
+        and scalers, which doesn't depend on TensorFlow.
+        Raises ValueError if the network or scalers can't be converted.
+        """
+        if not self.compile_predictor():
+            raise ValueError("Model must only consist of Dense layers")
+
+        if self._input_scaler and self._input_affine is None:
+            raise ValueError("Input scaler is not an affine map")
+        if self._output_scaler and self._output_affine is None:
+            raise ValueError("Output scaler is not an affine map")
+
+        return NumpyEmulator(
+            self._network,
+            self._n_parameters,
+            input_affine=self._input_affine,
+            output_affine=self._output_affine,
+        )
+
+    def export(self, path):
         """
-        Additional **kwargs can be provided to Keras's predict method
+        Writes the trained network and scaler state to a compact ``.npz``
+        file, which can be loaded without TensorFlow with
+        :meth:`NumpyEmulator.load`.
         """
-        x = x.reshape((1, self.n_parameters()))
+        self.to_numpy().save(path)
 
-        if self._input_scaler:
-            x = self._input_scaler.transform(x)
+    def _save_state(self, path):
+        """
+        Weights of the NumPy network and of the Keras model are stored as
+        arrays, so that loading doesn't need TensorFlow.
+        """
+        if self._network is not None:
+            NumpyEmulator(self._network, self._n_parameters).save(
+                os.path.join(path, "network.npz"))
+
+        np.savez(os.path.join(path, "model.npz"), *self._model.get_weights())
+        return {
+            "model_size": self._model_size,
+            "has_network": self._network is not None,
+        }
 
-        # convert to np array
-        #if type(x) != np.ndarray:
-        #   x = np.asarray(x)
+    def _load_state(self, path, state, mmap_mode):
+        self._model_size = state["model_size"]
+        self._network = None
+        if state["has_network"]:
+            self._network = NumpyEmulator.load(
+                os.path.join(path, "network.npz"))._network
 
-        y = self._model.predict([x])
+        with np.load(os.path.join(path, "model.npz")) as data:
+            self._model_weights = [data["arr_" + str(i)]
+                                   for i in range(len(data.files))]
 
-        if self._output_scaler:
-            y = self._output_scaler.inverse_transform(y)
+    def _restore_model(self):
+        """
+        Rebuilds the Keras model of a loaded emulator with the saved weights.
+        The model has to be compiled with set_parameters() before training.
+        """
+        from .models import create_model
 
-        return y
+        weights = self.__dict__.pop("_model_weights")
+        self._model = create_model(self._n_parameters, self._model_size)
+        self._model.set_weights(weights)
 
     def set_parameters(self, loss='mse', optimizer='adam',
                        metrics=['mae'], **kwargs):
@@ -79,6 +197,12 @@ class NNEmulator(Emulator):
         """
         Training neural network and return history
         """
+        profiler = self._profiler
+        if profiler is not None:
+            kwargs['callbacks'] = list(kwargs.get('callbacks', [])) + \
+                [_epoch_timer(profiler)]
+            start = time.time()
+
         history = self._model.fit(
                     self._X,
                     self._y,
@@ -90,6 +214,16 @@ class NNEmulator(Emulator):
 
         # save to return in the future
         self._history = history
+        self.compile_predictor()
+
+        if profiler is not None:
+            profiler.record_event(
+                "fit",
+                time.time() - start,
+                n_points=len(self._X),
+                epochs=len(history.epoch),
+                batch_size=batch_size,
+            )
 
         return history
 
@@ -115,3 +249,19 @@ class NNEmulator(Emulator):
         assert hasattr(self, "_history"), "Must first train NN"
 
         return self._history
+
+
+def _epoch_timer(profiler):
+    """
+    Returns a Keras callback recording the time of every training epoch.
+    """
+    from tensorflow import keras
+
+    class EpochTimer(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self._start = profiler.clock()
+
+        def on_epoch_end(self, epoch, logs=None):
+            profiler.lap("fit_epoch", self._start)
+
+    return EpochTimer()
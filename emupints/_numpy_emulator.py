@@ -0,0 +1,127 @@
+#
+# Dependency-free inference engine for exported neural network emulators
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import _LogLikelihood, _batch_array
+from ._dense import DenseNetwork
+import numpy as np
+
+
+class NumpyEmulator(_LogLikelihood):
+    """
+    *Extends:* :class:`LogLikelihood` (:class:`LogPDF` for older pints)
+
+    Trained neural network emulator evaluated with NumPy matrix multiplies
+    only. It is created by :meth:`NNEmulator.export` or
+    :meth:`NNEmulator.to_numpy` and never imports TensorFlow, which makes it
+    cheap to load and to send to worker processes.
+
+    Arguments:
+
+    ``network``
+        A :class:`DenseNetwork`.
+    ``n_parameters``
+        Number of parameters of the emulated likelihood.
+    ``input_affine``
+        (Optional) Tuple (scale, offset) of the input scaler.
+    ``output_affine``
+        (Optional) Tuple (scale, offset) mapping network outputs back to
+        log-likelihood values.
+    """
+
+    def __init__(self, network, n_parameters, input_affine=None,
+                 output_affine=None):
+        self._network = network
+        self._n_parameters = n_parameters
+
+        if input_affine is None:
+            input_affine = (np.ones(n_parameters), np.zeros(n_parameters))
+        if output_affine is None:
+            output_affine = (np.ones(1), np.zeros(1))
+
+        self._input_scale, self._input_offset = input_affine
+        self._output_scale, self._output_offset = output_affine
+
+    def __call__(self, x):
+        x = np.asarray(x)
+        if x.ndim == 2:
+            return self.evaluate_batch(x)
+
+        x = x.reshape((1, self._n_parameters))
+        return float(self._predict(x)[0, 0])
+
+    def evaluate_batch(self, X):
+        """
+        Returns the emulated log-likelihood for every row of ``X``.
+        """
+        X = _batch_array(X, self._n_parameters)
+
+        return self._predict(X).reshape(len(X))
+
+    def evaluateS1(self, x):
+        """
+        Returns the emulated log-likelihood and its gradient with respect to
+        the parameters, see :meth:`pints.LogPDF.evaluateS1`.
+        """
+        y, dy = self.evaluateS1_batch(x)
+        return float(y[0]), dy[0]
+
+    def evaluateS1_batch(self, X):
+        """
+        Returns the emulated log-likelihood (an array of length N) and its
+        gradients (N by n_parameters) for every row of ``X``.
+        """
+        X = _batch_array(X, self._n_parameters)
+
+        X = X * self._input_scale + self._input_offset
+        y, dy = self._network.gradient(X)
+        y = y * self._output_scale + self._output_offset
+        dy = dy[:, :, 0] * self._input_scale * self._output_scale
+        return y.reshape(len(X)), dy
+
+    def _predict(self, X):
+        X = X * self._input_scale + self._input_offset
+        y = self._network(X)
+        return y * self._output_scale + self._output_offset
+
+    def n_parameters(self):
+        return self._n_parameters
+
+    def save(self, path):
+        """
+        Writes weights, biases, activations and scaler state to a
+        compressed ``.npz`` file.
+        """
+        weights, biases, activations = self._network.weights()
+        arrays = {
+            "n_parameters": np.array(self._n_parameters),
+            "activations": np.array(activations),
+            "input_scale": self._input_scale,
+            "input_offset": self._input_offset,
+            "output_scale": self._output_scale,
+            "output_offset": self._output_offset,
+        }
+        for i, (W, b) in enumerate(zip(weights, biases)):
+            arrays["W_" + str(i)] = W
+            arrays["b_" + str(i)] = b
+
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an emulator written by save() or :meth:`NNEmulator.export`.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            activations = [str(a) for a in data["activations"]]
+            weights = [data["W_" + str(i)] for i in range(len(activations))]
+            biases = [data["b_" + str(i)] for i in range(len(activations))]
+            return cls(
+                DenseNetwork(weights, biases, activations),
+                int(data["n_parameters"]),
+                input_affine=(data["input_scale"], data["input_offset"]),
+                output_affine=(data["output_scale"], data["output_offset"]),
+            )
@@ -6,6 +6,7 @@ import pints
 import pints.toy as toy
 
 from . import utils as emutils
+from ._cache import problem_key
 import numpy as np
 
 import copy
@@ -97,22 +98,45 @@ class Problems():
     }
 
     @staticmethod
-    def load_problem(problem_dict):
+    def load_problem(problem_dict, seed=None, cache=None):
         """
         Returns a dictionary containing an instantiated PINTS problem
+
+        Arguments:
+
+        ``problem_dict``
+            One of the problem dictionaries defined in this class.
+        ``seed``
+            (Optional) Seed for the noise added to simulated data.
+        ``cache``
+            (Optional) :class:`EvaluationCache` storing simulated data, so
+            it is only simulated once for each problem and seed. Only used
+            when a seed is given, as data is random otherwise.
         """
         problem_instance = copy.deepcopy(problem_dict)
 
         model = problem_dict["model"]()
         parameters = problem_dict['parameters']
 
+        cached = None
+        if cache is not None and seed is not None:
+            key = problem_key(problem_dict, seed)
+            cached = cache.load_arrays(key, "data")
+
+        if cached is not None:
+            values, times = cached['values'], cached['times']
+            noise_stds = cached.get('noise_stds')
+            # scalar noise of single output problems is saved as a 0-d array
+            if noise_stds is not None and noise_stds.ndim == 0:
+                noise_stds = noise_stds.item()
         # simulate problem
-        if 'simulation_noise_percent' in problem_dict:
+        elif 'simulation_noise_percent' in problem_dict:
             values, times, noise_stds = emutils.simulate(
                 model,
                 parameters=problem_dict['parameters'],
                 times=problem_dict['times'],
                 noise_range_percent=problem_dict['simulation_noise_percent'],
+                random_state=seed,
             )
         else:
             values, times = emutils.simulate(
@@ -123,6 +147,12 @@ class Problems():
             )
             noise_stds = None
 
+        if cache is not None and seed is not None and cached is None:
+            data = {'values': values, 'times': times}
+            if noise_stds is not None:
+                data['noise_stds'] = noise_stds
+            cache.save_arrays(key, "data", **data)
+
         # create instance of a problem and
         if problem_dict['n_outputs'] == 1:
             problem = pints.SingleOutputProblem(model, times, values)
@@ -167,3 +197,107 @@ class Problems():
         })
 
         return problem_instance
+
+    @staticmethod
+    def generate_training_data(problem, n_samples, design="lhs", seed=None,
+                               n_workers=None, chunk_size=None, cache=None):
+        """
+        Returns inputs X and log-likelihoods y for training emulators.
+
+        Arguments:
+
+        ``problem``
+            Problem dictionary, either one of the class attributes or an
+            instance returned by load_problem(). Class attributes are loaded
+            with the given seed.
+        ``n_samples``
+            Number of training points.
+        ``design``
+            (Optional) How points are placed inside the problem bounds:
+            "lhs" (Latin hypercube), "sobol" or "uniform".
+            See :func:`utils.sample_design`.
+        ``seed``
+            (Optional) Seed making the design reproducible.
+        ``n_workers``
+            (Optional) Number of processes evaluating the likelihood,
+            all cores by default.
+        ``chunk_size``
+            (Optional) Number of points sent to a worker at once.
+        ``cache``
+            (Optional) :class:`EvaluationCache`, points already evaluated
+            for this problem are read from it and new ones are appended.
+
+        Returns contiguous float64 arrays X (n_samples by n_parameters)
+        and y (n_samples).
+        """
+        if 'log_likelihood' not in problem or \
+                not isinstance(problem['log_likelihood'], pints.LogPDF):
+            problem = Problems.load_problem(problem, seed=seed, cache=cache)
+
+        bounds = problem['bounds']
+        X = emutils.sample_design(
+            bounds.lower(),
+            bounds.upper(),
+            n_samples,
+            design=design,
+            seed=seed,
+        )
+        if cache is not None:
+            key = problem_key(problem)
+            y, found = cache.lookup(key, X)
+        else:
+            y, found = np.empty(n_samples), np.zeros(n_samples, dtype=bool)
+
+        missing = ~found
+        if np.any(missing):
+            y[missing] = emutils.evaluate_parallel(
+                problem['log_likelihood'],
+                X[missing],
+                n_workers=n_workers,
+                chunk_size=chunk_size,
+            )
+            if cache is not None:
+                cache.append(key, X[missing], y[missing])
+
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.ascontiguousarray(y, dtype=np.float64)
+
+        return X, y
+
+    @staticmethod
+    def generate_trajectory_data(problem, n_samples, design="lhs", seed=None,
+                                 n_workers=None, chunk_size=None):
+        """
+        Returns inputs X and simulated outputs Y for training a
+        :class:`TrajectoryEmulator`. Outputs are simulated without noise at
+        the problem times.
+
+        Arguments are the same as for :meth:`generate_training_data`.
+
+        Returns contiguous float64 arrays X (n_samples by n_parameters)
+        and Y (n_samples by n_times by n_outputs).
+        """
+        if 'log_likelihood' not in problem or \
+                not isinstance(problem['log_likelihood'], pints.LogPDF):
+            problem = Problems.load_problem(problem, seed=seed)
+
+        bounds = problem['bounds']
+        X = emutils.sample_design(
+            bounds.lower(),
+            bounds.upper(),
+            n_samples,
+            design=design,
+            seed=seed,
+        )
+        Y = emutils.simulate_parallel(
+            problem['model'],
+            X,
+            problem['times'],
+            n_workers=n_workers,
+            chunk_size=chunk_size,
+        )
+
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        Y = np.ascontiguousarray(Y, dtype=np.float64)
+
+        return X, Y
@@ -0,0 +1,210 @@
+#
+# Opt-in instrumentation of emulator calls and training
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import json
+import math
+import time
+
+# latency histogram: 4 log-spaced bins per decade from 100ns to 100s
+_MIN_EXPONENT = -7
+_BINS_PER_DECADE = 4
+_N_BINS = 9 * _BINS_PER_DECADE
+
+
+class Profiler(object):
+    """
+    Records call counts, batch sizes and latencies of the stages of emulator
+    calls, as well as the wall-clock time of fitting and optimization.
+
+    Attach a profiler to an emulator with
+    :meth:`Emulator.enable_profiling`; the same profiler can be shared by
+    several emulators. Emulators without a profiler only pay for a single
+    attribute check per call.
+
+    Latencies are kept in histograms with 4 logarithmic bins per decade
+    between 100ns and 100s (values outside go to the first or last bin), so
+    memory use doesn't grow with the number of calls. Reported percentiles
+    are the upper edges of the bins they fall in.
+
+    Example::
+
+        profiler = emulator.enable_profiling()
+        emulator.evaluate_batch(X)
+        print(profiler.to_json())
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Removes all recorded measurements.
+        """
+        self._stages = {}
+        self._events = []
+
+    def record(self, stage, seconds, n_points=None):
+        """
+        Records a call of ``stage`` that took ``seconds``, optionally
+        with the number of points it evaluated.
+        """
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = _StageStatistics()
+        stats.add(seconds, n_points)
+
+    def lap(self, stage, start, n_points=None):
+        """
+        Records the time elapsed since ``start`` (a value of :meth:`clock`)
+        as a call of ``stage`` and returns the current clock, so that
+        consecutive stages can be timed with::
+
+            start = profiler.clock()
+            ...
+            start = profiler.lap("first", start)
+            ...
+            start = profiler.lap("second", start)
+        """
+        now = self.clock()
+        self.record(stage, now - start, n_points)
+        return now
+
+    def stage(self, stage, n_points=None):
+        """
+        Returns a context manager recording the time spent in its block as
+        a call of ``stage``.
+        """
+        return _Timer(self, stage, n_points)
+
+    def record_event(self, name, seconds, **details):
+        """
+        Records a single long running operation, e.g. fitting, with any
+        details given as keyword arguments. Events are listed individually
+        in the report and also aggregated as a stage.
+        """
+        event = {"name": name, "seconds": seconds}
+        event.update(details)
+        self._events.append(event)
+        self.record(name, seconds)
+
+    def stages(self):
+        """
+        Returns the names of all recorded stages.
+        """
+        return sorted(self._stages)
+
+    def to_dict(self):
+        """
+        Returns a report of all measurements as a dictionary with
+        ``stages``, mapping every stage name to its statistics, and the list
+        of ``events``.
+        """
+        return {
+            "stages": dict(
+                (name, stats.to_dict())
+                for name, stats in sorted(self._stages.items())),
+            "events": [dict(event) for event in self._events],
+        }
+
+    def to_json(self, path=None, indent=2):
+        """
+        Returns the report of :meth:`to_dict` as a JSON string, which is
+        also written to ``path`` if given.
+        """
+        text = json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+
+class _StageStatistics(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = float("inf")
+        self.max = 0.
+        self.histogram = [0] * _N_BINS
+
+        # batch sizes in power of two bins: 1, 2-3, 4-7, ...
+        self.n_points = 0
+        self.batch_histogram = {}
+
+    def add(self, seconds, n_points):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        if seconds > 0:
+            i = int((math.log10(seconds) - _MIN_EXPONENT) * _BINS_PER_DECADE)
+            i = min(max(i, 0), _N_BINS - 1)
+        else:
+            i = 0
+        self.histogram[i] += 1
+
+        if n_points is not None:
+            self.n_points += n_points
+            b = int(n_points).bit_length()
+            self.batch_histogram[b] = self.batch_histogram.get(b, 0) + 1
+
+    def percentile(self, q):
+        """
+        Returns the upper edge of the histogram bin holding the q-th
+        percentile.
+        """
+        rank = q / 100. * self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= rank:
+                return min(_bin_edge(i + 1), self.max)
+        return self.max
+
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "histogram": dict(
+                ("{:.3g}".format(_bin_edge(i + 1)), n)
+                for i, n in enumerate(self.histogram) if n),
+        }
+        if self.batch_histogram:
+            result["n_points"] = self.n_points
+            result["mean_batch_size"] = self.n_points / self.count
+            result["batch_sizes"] = dict(
+                (str(2 ** (b - 1)) if b > 0 else "0", n)
+                for b, n in sorted(self.batch_histogram.items()))
+        return result
+
+
+def _bin_edge(i):
+    return 10. ** (_MIN_EXPONENT + i / _BINS_PER_DECADE)
+
+
+class _Timer(object):
+    def __init__(self, profiler, stage, n_points):
+        self._profiler = profiler
+        self._stage = stage
+        self._n_points = n_points
+
+    def __enter__(self):
+        self._start = self._profiler.clock()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.lap(self._stage, self._start, self._n_points)
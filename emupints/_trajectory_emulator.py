@@ -0,0 +1,406 @@
+#
+# Emulator of the time series simulated by a forward model
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from ._emulator import _InputHandling, affine_map
+from ._gp_predictor import compile_mean_predictor
+import numpy as np
+import pints
+
+
+# Newer versions of pints renamed KnownNoiseLogLikelihood
+_KnownNoiseLogLikelihood = getattr(
+    pints, "GaussianKnownSigmaLogLikelihood", pints.KnownNoiseLogLikelihood)
+
+
+class TrajectoryEmulator(pints.ForwardModelS1, _InputHandling):
+    """
+    *Extends:* :class:`pints.ForwardModelS1`
+
+    Emulates the outputs of a forward model, i.e. the simulated time series,
+    instead of a single log-likelihood.
+
+    Trajectories are compressed with a principal component analysis (an SVD
+    of the centred training outputs) and an independent Gaussian Process is
+    fitted to the score of every component kept. A prediction is mapped back
+    to the full time series, so the emulator can be used as the model of any
+    :class:`pints.SingleOutputProblem` or :class:`pints.MultiOutputProblem`
+    and likelihoods are computed exactly on top of it. One trained emulator
+    therefore serves different noise levels, priors and data sets without
+    any new simulations, see :meth:`log_likelihood`.
+
+    Arguments:
+
+    ``X``
+        N by n_parameters matrix of parameters used for simulations.
+    ``Y``
+        Simulated outputs, N by n_times for models with a single output or
+        N by n_times by n_outputs, see
+        :meth:`Problems.generate_trajectory_data`.
+    ``times``
+        The n_times time points outputs were simulated at.
+    ``n_components``
+        (Optional) Number of principal components kept. By default the
+        smallest number explaining ``explained_variance`` of the variance.
+    ``explained_variance``
+        (Optional) Fraction of variance kept when ``n_components`` is not
+        given.
+    ``input_scaler``
+        (Optional) sklearn scaler applied to the parameters, as for
+        :class:`Emulator`.
+
+    Outputs are divided by their standard deviation before the SVD, so
+    outputs with a larger range don't dominate the components.
+    """
+
+    # incremented whenever predictions change, as for Emulator
+    _version = 0
+
+    def __init__(self, X, Y, times, n_components=None,
+                 explained_variance=0.9999, input_scaler=False):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        times = np.asarray(times, dtype=float)
+
+        if X.ndim != 2:
+            raise ValueError("Input should be 2 dimensional")
+        if Y.ndim == 2:
+            Y = Y.reshape(Y.shape + (1, ))
+        if Y.ndim != 3:
+            raise ValueError(
+                "Outputs should have shape (N, n_times, n_outputs)")
+        if len(X) != len(Y):
+            raise ValueError("Input and output dimensions don't match")
+        if times.ndim != 1 or len(times) != Y.shape[1]:
+            raise ValueError("Outputs should be given at every time point")
+        if np.any(np.diff(times) <= 0):
+            raise ValueError("Times should be strictly increasing")
+        if not 0 < explained_variance <= 1:
+            raise ValueError("Explained variance must be in (0, 1]")
+
+        self._n_parameters = X.shape[1]
+        self._n_outputs = Y.shape[2]
+        self._times = times
+
+        self._input_scaler = input_scaler
+        self._input_affine = None
+        if input_scaler:
+            self._input_scaler.fit(X)
+            self._input_affine = affine_map(
+                self._input_scaler.transform, self._n_parameters)
+            self._X = self._input_scaler.transform(X)
+        else:
+            self._X = np.array(X)
+
+        # centred and standardized outputs, one row per simulation
+        self._mean = np.mean(Y, axis=0)
+        self._scale = np.std(Y - self._mean, axis=(0, 1))
+        self._scale[self._scale == 0] = 1
+        R = ((Y - self._mean) / self._scale).reshape((len(Y), -1))
+
+        _, s, Vt = np.linalg.svd(R, full_matrices=False)
+        variance = s ** 2
+        total = np.sum(variance)
+        if total > 0:
+            self._explained = variance / total
+        else:
+            self._explained = np.zeros(len(s))
+
+        if n_components is None:
+            n_components = 1 + np.searchsorted(
+                np.cumsum(self._explained), explained_variance * (1 - 1e-12))
+        n_components = int(min(n_components, len(s)))
+        if n_components < 1:
+            raise ValueError("Number of components must be positive")
+
+        self._components = Vt[:n_components]
+        self._scores = np.dot(R, self._components.T)
+
+        residual = R - np.dot(self._scores, self._components)
+        residual = residual.reshape(Y.shape) * self._scale
+        self._compression_error = np.max(np.abs(residual), axis=(0, 1))
+
+        self._kernel = None
+        self._optimizer = None
+        self._gps = None
+        self._predictors = None
+        self._basis_cache = None
+
+    def n_parameters(self):
+        return self._n_parameters
+
+    def n_outputs(self):
+        return self._n_outputs
+
+    def n_components(self):
+        """
+        Returns the number of principal components emulated.
+        """
+        return len(self._components)
+
+    def times(self):
+        """
+        Returns the time points of the training trajectories.
+        """
+        return self._times
+
+    def explained_variance_ratio(self):
+        """
+        Returns the fraction of (standardized) output variance explained by
+        every principal component of the training data, largest first.
+        """
+        return self._explained
+
+    def compression_error(self):
+        """
+        Returns the largest absolute error of reconstructing the training
+        trajectories from the principal components kept, for every output.
+        This is a lower bound for the error of the emulator.
+        """
+        return self._compression_error
+
+    def set_parameters(self, kernel=None, optimizer=None):
+        """
+        Sets the GPy kernel (copied for every component) and optimizer used
+        by :meth:`fit`. By default an RBF kernel with a lengthscale for
+        every parameter is used.
+        """
+        if kernel:
+            self._kernel = kernel
+
+        if optimizer:
+            self._optimizer = optimizer
+
+    def fit(self, optimize=True, messages=False, **kwargs):
+        """
+        Fits a GP to the scores of every principal component.
+        **kwargs are passed to the ``GPy.models.GPRegression`` of every
+        component, outputs are normalized unless ``normalizer`` is given.
+        """
+        import GPy
+
+        kwargs.setdefault("normalizer", True)
+        if self._kernel is None:
+            kernel = GPy.kern.RBF(self._n_parameters, ARD=True)
+        else:
+            kernel = self._kernel
+
+        self._gps = []
+        for k in range(self.n_components()):
+            gp = GPy.models.GPRegression(
+                self._X, self._scores[:, k:k + 1], kernel.copy(), **kwargs)
+            if optimize:
+                if self._optimizer is not None:
+                    gp.optimize(self._optimizer, messages=messages)
+                else:
+                    gp.optimize(messages=messages)
+            self._gps.append(gp)
+
+        self.compile_predictor()
+
+    def _changed(self):
+        """
+        Marks predictions of the emulator as changed.
+        """
+        self._version += 1
+
+    def compile_predictor(self):
+        """
+        Caches posterior weights of the GPs, so predictions are computed with
+        NumPy only. Called automatically by :meth:`fit`, call it manually
+        after changing the GPy models directly.
+        Returns False if any kernel is not supported, in which case
+        predictions fall back to GPy.
+        """
+        assert self._gps is not None, "Must first fit GPs to data"
+
+        self._changed()
+        predictors = [compile_mean_predictor(gp) for gp in self._gps]
+        if any(p is None for p in predictors):
+            self._predictors = None
+            return False
+        self._predictors = predictors
+        return True
+
+    def get_gps(self):
+        """
+        Returns the list of GPy models, one for each principal component.
+        """
+        assert self._gps is not None, "Must first fit GPs to data"
+
+        return self._gps
+
+    def predict_scores(self, X):
+        """
+        Returns the predicted scores (N by n_components) of the principal
+        components for an N by n_parameters matrix of inputs.
+        """
+        return self._predict_scores(self._transform_input(self._as_batch(X)))
+
+    def _predict_scores(self, Z):
+        assert self._predictors is not None or self._gps is not None, \
+            "Must first fit GPs to data"
+
+        if self._predictors is not None:
+            return np.hstack([p(Z) for p in self._predictors])
+        return np.hstack([gp.predict_noiseless(Z)[0] for gp in self._gps])
+
+    def _predict_scores_gradient(self, Z):
+        """
+        Returns scores (N by n_components) and their gradients with respect
+        to the scaled inputs (N by n_parameters by n_components).
+        """
+        assert self._predictors is not None or self._gps is not None, \
+            "Must first fit GPs to data"
+
+        if self._predictors is not None:
+            results = [p.gradient(Z) for p in self._predictors]
+        else:
+            results = [(gp.predict_noiseless(Z)[0],
+                        gp.predictive_gradients(Z)[0])
+                       for gp in self._gps]
+
+        scores = np.hstack([r[0] for r in results])
+        gradients = np.concatenate([r[1] for r in results], axis=2)
+        return scores, gradients
+
+    def simulate(self, parameters, times):
+        """
+        Returns the emulated outputs at the given times, see
+        :meth:`pints.ForwardModel.simulate`. Times other than the training
+        times are linearly interpolated.
+        """
+        y = self.simulate_batch(parameters, times)[0]
+        if self._n_outputs == 1:
+            return y[:, 0]
+        return y
+
+    def simulateS1(self, parameters, times):
+        """
+        Returns the emulated outputs and their derivatives with respect to
+        the parameters, see :meth:`pints.ForwardModelS1.simulateS1`.
+        """
+        X = self._as_batch(parameters)
+        mean, basis = self._basis(times)
+
+        scores, gradients = self._predict_scores_gradient(
+            self._transform_input(X))
+        if self._input_affine is not None:
+            gradients = gradients * self._input_affine[0][:, None]
+        elif self._input_scaler:
+            raise ValueError("Gradients need an affine input scaler")
+
+        y = mean + np.einsum("k,kto->to", scores[0], basis)
+        dy = np.einsum("dk,kto->tod", gradients[0], basis)
+        if self._n_outputs == 1:
+            return y[:, 0], dy[:, 0, :]
+        return y, dy
+
+    def simulate_batch(self, X, times=None):
+        """
+        Returns the emulated outputs for every row of the N by n_parameters
+        matrix ``X`` as an N by n_times by n_outputs array, all predicted
+        with a single call of every GP. Training times are used by default.
+        """
+        X = self._as_batch(X)
+        mean, basis = self._basis(times)
+
+        scores = self._predict_scores(self._transform_input(X))
+        return mean + np.einsum("nk,kto->nto", scores, basis)
+
+    def _basis(self, times):
+        """
+        Returns the mean (n_times by n_outputs) and the scaled components
+        (n_components by n_times by n_outputs) at the given times.
+        """
+        if times is None:
+            times = self._times
+        times = np.asarray(times, dtype=float)
+
+        cached = self._basis_cache
+        if cached is not None and np.array_equal(cached[0], times):
+            return cached[1], cached[2]
+
+        shape = (len(self._components), len(self._times), self._n_outputs)
+        mean = self._mean
+        basis = self._components.reshape(shape) * self._scale
+
+        if not np.array_equal(times, self._times):
+            if times.ndim != 1 or np.min(times) < self._times[0] or \
+                    np.max(times) > self._times[-1]:
+                raise ValueError("Times outside the range of training times")
+
+            # linear interpolation is a fixed matrix W, so that the outputs
+            # at new times are W times the outputs at the training times
+            W = np.array([np.interp(times, self._times, e)
+                          for e in np.eye(len(self._times))]).T
+            mean = np.einsum("st,to->so", W, mean)
+            basis = np.einsum("st,kto->kso", W, basis)
+
+        self._basis_cache = (np.array(times), mean, basis)
+        return mean, basis
+
+    def log_likelihood(self, values, noise_stds, times=None):
+        """
+        Returns a known noise Gaussian log-likelihood of the given data, with
+        outputs simulated by this emulator.
+
+        Arguments:
+
+        ``values``
+            Observed data, n_times (by n_outputs).
+        ``noise_stds``
+            Standard deviation of the noise, a scalar or one for each output.
+        ``times``
+            (Optional) Time points of the data, training times by default.
+
+        The returned :class:`LogPDF` also provides ``evaluate_batch``, so
+        emulated likelihoods can be used wherever emulators can.
+        """
+        if times is None:
+            times = self._times
+        if self._n_outputs == 1:
+            problem = pints.SingleOutputProblem(self, times, values)
+        else:
+            problem = pints.MultiOutputProblem(self, times, values)
+        return TrajectoryLogLikelihood(problem, noise_stds)
+
+
+class TrajectoryLogLikelihood(_KnownNoiseLogLikelihood):
+    """
+    *Extends:* :class:`pints.GaussianKnownSigmaLogLikelihood`
+
+    Known noise log-likelihood of a problem whose model is a
+    :class:`TrajectoryEmulator`, which adds ``evaluate_batch`` so that all
+    trajectories of a batch are predicted at once.
+    Usually created with :meth:`TrajectoryEmulator.log_likelihood`.
+    """
+
+    def __init__(self, problem, sigma):
+        super(TrajectoryLogLikelihood, self).__init__(problem, sigma)
+        self._emulator = problem.model()
+        if not isinstance(self._emulator, TrajectoryEmulator):
+            raise ValueError("Model of the problem must be a "
+                             "TrajectoryEmulator")
+
+        # constants of the batched likelihood, computed from the public
+        # arguments as those of the parent class are private
+        n_times, n_outputs = problem.n_times(), problem.n_outputs()
+        sigma = np.ones(n_outputs) * np.asarray(sigma, dtype=float)
+        self._batch_times = problem.times()
+        self._batch_values = np.asarray(problem.values(), dtype=float).reshape(
+            (1, n_times, n_outputs))
+        self._batch_offset = \
+            -0.5 * n_times * np.log(2 * np.pi) - n_times * np.log(sigma)
+        self._batch_multip = -0.5 / sigma ** 2
+
+    def evaluate_batch(self, X):
+        """
+        Returns the log-likelihood for every row of ``X`` as an array.
+        """
+        Y = self._emulator.simulate_batch(X, self._batch_times)
+        error = np.sum((self._batch_values - Y) ** 2, axis=1)
+        return np.sum(self._batch_offset + self._batch_multip * error, axis=1)
@@ -2,6 +2,7 @@
 # A simple wrapper to transform a function into a basic emulator
 #
 
+from . import utils as emutils
 import pints
 
 
@@ -19,8 +20,19 @@ class EmulatorWrapper(pints.LogPDF):
     def __call__(self, x):
         return self._emu(x)
 
+    def evaluate_batch(self, X):
+        """
+        Returns values of the wrapped function for every row of ``X``, with
+        a single call if it supports batches.
+        """
+        return emutils.evaluate_batch(self._emu, X)
+
     def evaluateS1(self, x):
-        pass
+        """
+        Returns value and gradient of the wrapped emulator, which must
+        implement evaluateS1().
+        """
+        return self._emu.evaluateS1(x)
 
     def n_parameters(self):
         return self._n_parameters
@@ -0,0 +1,182 @@
+#
+# Automatic search over compositional GPy kernels
+#
+
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+from . import utils as emutils
+import multiprocessing
+import numpy as np
+import time
+import GPy
+
+
+def default_base_kernels(n_parameters):
+    """
+    Returns the base kernels combined by :func:`kernel_search` by default.
+    """
+    return [
+        GPy.kern.RBF(n_parameters, ARD=True),
+        GPy.kern.Matern52(n_parameters, ARD=True),
+        GPy.kern.Matern32(n_parameters, ARD=True),
+        GPy.kern.Linear(n_parameters),
+    ]
+
+
+def kernel_search(X, y,
+                  base_kernels=None,
+                  max_depth=3,
+                  beam_width=1,
+                  criterion="bic",
+                  budget=None,
+                  n_jobs=None,
+                  model=GPy.models.GPRegression,
+                  memo=None,
+                  messages=False,
+                  **kwargs):
+    """
+    Greedy search for a composite kernel, in the spirit of automatic
+    statistician style structure search.
+
+    Starts from the base kernels; on every level the best ``beam_width``
+    kernels of the previous level are extended by adding or multiplying
+    them with each base kernel. Candidates of a level are fitted
+    concurrently in worker processes. Every structure is identified by
+    :func:`utils.canonical_kernel_string`, so equivalent structures
+    (e.g. a + b and b + a) are only ever fitted once.
+
+    Arguments:
+
+    ``X``
+        N by n_parameters matrix of (scaled) training inputs.
+    ``y``
+        N by 1 (scaled) training targets.
+    ``base_kernels``
+        (Optional) List of GPy kernels to combine, see
+        :func:`default_base_kernels`.
+    ``max_depth``
+        (Optional) Maximum number of base kernels in a structure.
+    ``beam_width``
+        (Optional) Number of best kernels extended on each level.
+    ``criterion``
+        (Optional) "bic" (Bayesian information criterion, penalises the
+        number of hyperparameters) or "lml" (log marginal likelihood).
+    ``budget``
+        (Optional) Maximum number of kernels fitted.
+    ``n_jobs``
+        (Optional) Number of worker processes, all cores by default.
+    ``model``
+        (Optional) GPy model class used to score kernels.
+    ``memo``
+        (Optional) Dictionary of results from previous searches on the same
+        data, updated in place. Structures present in it are not refitted.
+    ``messages``
+        (Optional) Print the score of every fitted kernel.
+    **kwargs are passed to the GPy optimizer.
+
+    Returns a list of results sorted from best to worst. Each result is a
+    dictionary with the structure string, number of base kernels in it
+    (size), score (lower is better), log marginal likelihood, number of
+    hyperparameters, fitting time and the optimized kernel.
+    """
+    if criterion not in ("bic", "lml"):
+        raise ValueError("Unknown criterion: " + str(criterion))
+
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).reshape((len(X), 1))
+    if base_kernels is None:
+        base_kernels = default_base_kernels(X.shape[1])
+    if memo is None:
+        memo = {}
+
+    n_fitted = 0
+    candidates = [k.copy() for k in base_kernels]
+    for depth in range(max_depth):
+        # skip structures that were already fitted
+        tasks = []
+        seen = set()
+        for kernel in candidates:
+            structure = emutils.canonical_kernel_string(kernel)
+            if structure in memo or structure in seen:
+                continue
+            if budget is not None and n_fitted + len(tasks) >= budget:
+                break
+            seen.add(structure)
+            tasks.append((model, X, y, kernel, structure, depth + 1, kwargs))
+
+        n_fitted += len(tasks)
+        for result in _map(_score_kernel, tasks, n_jobs):
+            result["score"] = _score(result, criterion, len(X))
+            memo[result["structure"]] = result
+            if messages:
+                print("{:.4f} {}".format(result["score"],
+                                         result["structure"]))
+
+        if depth == max_depth - 1 or \
+                (budget is not None and n_fitted >= budget):
+            break
+
+        # extend the best structures of this level with every base kernel
+        level = [r for r in memo.values() if r["size"] == depth + 1]
+        results = sorted(level, key=lambda r: r["score"])
+        beam = [r["kernel"] for r in results[:beam_width]
+                if r["kernel"] is not None]
+        candidates = []
+        for kernel in beam:
+            for base in base_kernels:
+                candidates.append(kernel.copy() + base.copy())
+                candidates.append(kernel.copy() * base.copy())
+
+    return sorted(memo.values(), key=lambda r: r["score"])
+
+
+def _score(result, criterion, n_points):
+    """
+    Lower is better.
+    """
+    if criterion == "lml":
+        return -result["log_marginal_likelihood"]
+    return (-2 * result["log_marginal_likelihood"] +
+            result["n_hyperparameters"] * np.log(n_points))
+
+
+def _score_kernel(task):
+    """
+    Fits GP with given kernel, used in worker processes.
+    """
+    model, X, y, kernel, structure, size, kwargs = task
+    start = time.time()
+    try:
+        gp = model(X, y, kernel)
+        gp.optimize(messages=False, **kwargs)
+        log_marginal_likelihood = float(gp.log_likelihood())
+        n_hyperparameters = len(gp.optimizer_array)
+        kernel = gp.kern.copy()
+    except np.linalg.LinAlgError:
+        log_marginal_likelihood = -np.inf
+        n_hyperparameters = 0
+        kernel = None
+
+    return {
+        "structure": structure,
+        "size": size,
+        "log_marginal_likelihood": log_marginal_likelihood,
+        "n_hyperparameters": n_hyperparameters,
+        "time": time.time() - start,
+        "kernel": kernel,
+    }
+
+
+def _map(f, tasks, n_jobs):
+    if not tasks:
+        return []
+    if n_jobs == 1 or len(tasks) == 1:
+        return [f(task) for task in tasks]
+
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        return pool.map(f, tasks)
+    finally:
+        pool.close()
+        pool.join()
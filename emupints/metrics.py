@@ -2,6 +2,7 @@
 # Metrics used for comparing emulator performance
 #
 
+from . import utils as emutils
 import numpy as np
 
 
@@ -22,24 +23,88 @@ def mape(y_true, y_pred):
     return np.mean(np.abs((y_true - y_pred) / y_true))
 
 
-def chain_mae(chain, emu_log_posterior, log_posterior):
+def chain_mae(chain, emu_log_posterior, log_posterior, thin=1, unique=True,
+              n_workers=None):
     """
-    Calculate the error in predictions along one chain
+    Calculate the error in predictions along one chain, or along all chains
+    of an (n_chains, n_samples, n_parameters) array.
+    See :func:`chain_predictions` for the optional arguments.
     """
-    emu_prediction = np.apply_along_axis(emu_log_posterior, 1, chain).flatten()
-    real_prediction = np.apply_along_axis(log_posterior, 1, chain).flatten()
+    emu_prediction, real_prediction = chain_predictions(
+        chain, emu_log_posterior, log_posterior, thin=thin, unique=unique,
+        n_workers=n_workers)
     return mae(emu_prediction, real_prediction)
 
 
-def chain_mape(chain, emu_log_posterior, log_posterior):
+def chain_mape(chain, emu_log_posterior, log_posterior, thin=1, unique=True,
+               n_workers=None):
     """
-    Calculate the error in predictions along one chain
+    Calculate the error in predictions along one chain, or along all chains
+    of an (n_chains, n_samples, n_parameters) array.
+    See :func:`chain_predictions` for the optional arguments.
     """
-    emu_prediction = np.apply_along_axis(emu_log_posterior, 1, chain).flatten()
-    real_prediction = np.apply_along_axis(log_posterior, 1, chain).flatten()
+    emu_prediction, real_prediction = chain_predictions(
+        chain, emu_log_posterior, log_posterior, thin=thin, unique=unique,
+        n_workers=n_workers)
     return mape(emu_prediction, real_prediction)
 
 
+def chain_predictions(chain, emu_log_posterior, log_posterior, thin=1,
+                      unique=True, n_workers=None):
+    """
+    Evaluates emulated and true log-posterior for every sample of a chain.
+
+    Arguments:
+
+    ``chain``
+        An (n_samples, n_parameters) chain, or an
+        (n_chains, n_samples, n_parameters) array of chains.
+    ``emu_log_posterior``
+        Emulated log-posterior (or likelihood), evaluated in batches when it
+        supports them, see :func:`utils.evaluate_batch`.
+    ``log_posterior``
+        True log-posterior (or likelihood).
+    ``thin``
+        (Optional) Only every ``thin``-th sample of each chain is used.
+    ``unique``
+        (Optional) Evaluate repeated samples (rejected MCMC proposals) only
+        once. Predictions are still returned for every sample, so metrics
+        are unchanged.
+    ``n_workers``
+        (Optional) Number of processes evaluating the true log-posterior,
+        which must then be picklable. Evaluated serially by default.
+
+    Returns two arrays, emulated and true predictions for the samples.
+    """
+    chain = np.asarray(chain, dtype=float)
+    if chain.ndim == 2:
+        chain = chain[None]
+    if chain.ndim != 3:
+        raise ValueError(
+            "Chain should have shape (n_samples, n_parameters) or "
+            "(n_chains, n_samples, n_parameters)")
+
+    samples = chain[:, ::thin].reshape((-1, chain.shape[2]))
+    if unique:
+        samples, inverse = np.unique(samples, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+    emu_prediction = emutils.evaluate_batch(emu_log_posterior, samples)
+    if emutils._batch_function(log_posterior) is not None:
+        real_prediction = emutils.evaluate_batch(log_posterior, samples)
+    else:
+        # a pool needs a picklable log-posterior, so it is opt-in
+        real_prediction = emutils.evaluate_parallel(
+            log_posterior, samples,
+            n_workers=1 if n_workers is None else n_workers)
+
+    if unique:
+        emu_prediction = emu_prediction[inverse]
+        real_prediction = real_prediction[inverse]
+
+    return emu_prediction, real_prediction
+
+
 def estimate_parameters(chains):
     parameters = np.mean(np.mean(chains, axis=1), axis=0)
     std = np.std(np.std(chains, axis=1), axis=0)
@@ -7,6 +7,10 @@ from __future__ import print_function, unicode_literals
 
 from . import utils as emutils
 import numpy as np
+import weakref
+
+# Surfaces of plotted likelihoods, see _predict_panels()
+_SURFACE_CACHE = weakref.WeakKeyDictionary()
 
 
 def surface(
@@ -164,6 +168,75 @@ def confidence_interval(param_range, mean, conf, show_points=True):
     return fig, axes
 
 
+def clear_surface_cache():
+    """
+    Forgets all likelihood surfaces memoised by the plotting functions.
+    """
+    _SURFACE_CACHE.clear()
+
+
+def _predict_panels(log_likelihood, fixed_parameters, bounds, n_splits,
+                    n_workers=None, cache=True):
+    """
+    Returns the surface of ``log_likelihood`` for every list of fixed values
+    in ``fixed_parameters``.
+
+    Likelihoods without batch support are evaluated for all panels at
+    once, serially unless ``n_workers`` processes are requested.
+    With ``cache`` the surfaces are memoised by likelihood identity, fixed
+    values, bounds and resolution, so plotting the same likelihood again
+    doesn't evaluate it. Surfaces of an emulator are forgotten once it is
+    refitted or given new data. Memoised surfaces are read-only arrays.
+    """
+    lower, upper = bounds.lower(), bounds.upper()
+    keys = [(tuple((int(i), float(val)) for (i, val) in fixed),
+             int(n_splits), tuple(lower), tuple(upper))
+            for fixed in fixed_parameters]
+
+    memo = {}
+    if cache:
+        emulator = emutils._find_emulator(log_likelihood)
+        version = None if emulator is None else emulator._version
+        try:
+            cached_version, memo = _SURFACE_CACHE.get(
+                log_likelihood, (version, {}))
+            if cached_version != version:
+                memo = {}
+            _SURFACE_CACHE[log_likelihood] = (version, memo)
+        except TypeError:
+            # can't be weakly referenced, e.g. a bound method
+            memo = {}
+
+    missing = [k for k, key in enumerate(keys) if key not in memo]
+    # fixed_parameters may repeat a panel
+    missing = [k for k in missing if keys.index(keys[k]) == k]
+    grids = [emutils.generate_grid(lower, upper, n_splits,
+                                   fixed=fixed_parameters[k])[2]
+             for k in missing]
+
+    if grids:
+        if emutils._batch_function(log_likelihood) is not None:
+            surfaces = [emutils.predict_grid(log_likelihood, grid)
+                        for grid in grids]
+        else:
+            n_params = grids[0].shape[2]
+            X = np.vstack([grid.reshape((-1, n_params)) for grid in grids])
+            # a pool needs a picklable likelihood, so it is opt-in
+            values = emutils.evaluate_parallel(
+                log_likelihood, X,
+                n_workers=1 if n_workers is None else n_workers)
+            surfaces = values.reshape((len(grids),) + grids[0].shape[:2])
+
+        for k, surface in zip(missing, surfaces):
+            surface.flags.writeable = False
+            memo[keys[k]] = surface
+
+    results = [memo[key] for key in keys]
+    if not cache:
+        memo.clear()
+    return results
+
+
 def plot_surface_fixed_param(log_likelihood,
                              bounds,
                              fixed=None,
@@ -172,11 +245,19 @@ def plot_surface_fixed_param(log_likelihood,
                              contour=True,
                              additional_log_likelihoods=None,
                              precision=5,
+                             n_workers=None,
+                             cache=True,
                              **kwargs
                              ):
     """
     2d contour or a 3d plot for high-dimensional model.
     Have to provide fixed values for some parameters.
+
+    The surface of ``log_likelihood`` is memoised when ``cache`` is True,
+    so plotting it again, e.g. with other additional likelihoods, only
+    evaluates the additional ones. Likelihoods without batch support are
+    evaluated serially, or in a pool of ``n_workers`` processes if given
+    (the likelihood must then be picklable).
     """
     import matplotlib.pyplot as plt
 
@@ -204,14 +285,16 @@ def plot_surface_fixed_param(log_likelihood,
         p1_idx, p2_idx = 0, 1
 
     # generate surfaces
-    p1_grid, p2_grid, grid = emutils.generate_grid(
+    p1_grid, p2_grid, _ = emutils.generate_grid(
         bounds.lower(),
         bounds.upper(),
         n_splits,
         fixed=fixed
     )
 
-    likelihood_prediction = emutils.predict_grid(log_likelihood, grid)
+    likelihood_prediction = _predict_panels(
+        log_likelihood, [fixed or []], bounds, n_splits,
+        n_workers=n_workers, cache=cache)[0]
 
     # plotting
     if contour is True:
@@ -227,10 +310,9 @@ def plot_surface_fixed_param(log_likelihood,
         # predict other provided surfaces
         if additional_log_likelihoods:
             for likelihood in additional_log_likelihoods:
-                likelihood_prediction = emutils.predict_grid(
-                    likelihood,
-                    grid
-                )
+                likelihood_prediction = _predict_panels(
+                    likelihood, [fixed or []], bounds, n_splits,
+                    n_workers=n_workers, cache=False)[0]
                 ax.plot_surface(
                     p1_grid, p2_grid,
                     likelihood_prediction,
@@ -264,12 +346,18 @@ def plot_fixed_param_grid(log_likelihood,
                           index_to_param_name=None,
                           contour=True,
                           additional_log_likelihoods=None,
+                          n_workers=None,
+                          cache=True,
                           **kwargs
                           ):
     """
     Creates a 2d contour or a 3d plot grid.
     For high dimensional model fix by taking the mid-point.
 
+    Surfaces of all panels are computed before plotting; for likelihoods
+    without batch support all panels are evaluated together, in a pool of
+    worker processes if ``n_workers`` is given.
+
     Arguments:
 
     ``log_likelihood``
@@ -291,6 +379,14 @@ def plot_fixed_param_grid(log_likelihood,
         (Optional) If True draw 2d contour plot, otherwise 3d plot
     ``additional_log_likelihoods``
         (Optional) List of additional log_likelihoods to display.
+    ``n_workers``
+        (Optional) Number of processes used for likelihoods without batch
+        support, which must then be picklable. Evaluated serially by
+        default.
+    ``cache``
+        (Optional) If True surfaces of ``log_likelihood`` are memoised, so
+        re-plotting it (e.g. with other additional log_likelihoods) doesn't
+        evaluate it again. See :func:`clear_surface_cache`.
 
     Returns a ``matplotlib`` figure object and axes handle.
     """
@@ -310,6 +406,16 @@ def plot_fixed_param_grid(log_likelihood,
 
     fig, axes = plt.subplots(rows, cols, figsize=(5 * rows, 5 * cols))
 
+    panels = fixed_parameters[:rows * cols]
+    surfaces = _predict_panels(log_likelihood, panels, bounds, n_splits,
+                               n_workers=n_workers, cache=cache)
+    additional_surfaces = []
+    if contour is False and additional_log_likelihoods:
+        additional_surfaces = [
+            _predict_panels(likelihood, panels, bounds, n_splits,
+                            n_workers=n_workers, cache=False)
+            for likelihood in additional_log_likelihoods]
+
     for row in range(rows):
         for col in range(cols):
             # change of axes required for 3d plots
@@ -332,7 +438,7 @@ def plot_fixed_param_grid(log_likelihood,
                               if i not in [j for (j, _) in fixed]]
 
             # generate surfaces
-            p1_grid, p2_grid, grid = emutils.generate_grid(
+            p1_grid, p2_grid, _ = emutils.generate_grid(
                 bounds.lower(),
                 bounds.upper(),
                 n_splits,
@@ -344,7 +450,7 @@ def plot_fixed_param_grid(log_likelihood,
                 p1_idx, p2_idx = p2_idx, p1_idx
                 p1_grid, p2_grid = p2_grid, p1_grid
 
-            likelihood_prediction = emutils.predict_grid(log_likelihood, grid)
+            likelihood_prediction = surfaces[row * cols + col]
 
             # plotting
             if contour is True:
@@ -358,11 +464,9 @@ def plot_fixed_param_grid(log_likelihood,
                                 **kwargs
                                 )
                 if additional_log_likelihoods:
-                    for likelihood in additional_log_likelihoods:
-                        likelihood_prediction = emutils.predict_grid(
-                            likelihood,
-                            grid
-                        )
+                    for panel_surfaces in additional_surfaces:
+                        likelihood_prediction = \
+                            panel_surfaces[row * cols + col]
                         ax.plot_surface(
                             p1_grid, p2_grid,
                             likelihood_prediction,
@@ -6,7 +6,9 @@ from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
 import numpy as np
-from GPy import kern
+import multiprocessing
+
+# GPy is only imported by functions that need it, as it is slow to import
 
 
 def fix_parameters(bounds):
@@ -58,32 +60,303 @@ def generate_grid(lower, upper, splits, fixed=[]):
     p2_range = np.linspace(p2_low, p2_high, splits)
     p1_grid, p2_grid = np.meshgrid(p1_range, p2_range)
 
-    if fixed:
-        # create a grid for every parameter and insert in
-        # corresponding position in the grids array
-        grids = [None] * n_params
-        grids[p1_idx] = p1_grid
-        grids[p2_idx] = p2_grid
-        for (i, val) in fixed:
-            fixed_grid = np.zeros((splits, splits)) + val
-            grids[i] = fixed_grid
-    else:
-        grids = [p1_grid, p2_grid]
+    if not fixed:
+        n_params = 2
+        p1_idx, p2_idx = 0, 1
 
-    grid = np.dstack(tuple(grids))
+    # fill the stacked grid directly, fixed values are broadcast
+    grid = np.empty((splits, splits, n_params))
+    grid[:, :, p1_idx] = p1_grid
+    grid[:, :, p2_idx] = p2_grid
+    for (i, val) in fixed:
+        grid[:, :, i] = val
 
     return p1_grid, p2_grid, grid
 
 
-def predict_grid(model, grid, dims=None):
+def predict_grid(model, grid, dims=None, chunk_size=4096, n_workers=None,
+                 threads=False, out=None):
     """
     Given a PDF and a grid of inputs calculates probability for
-    each index in the grid
+    each index in the grid.
+
+    Models with batch support (see :func:`evaluate_batch`) are evaluated
+    ``chunk_size`` points at a time. Other models are evaluated point by
+    point, in a pool of ``n_workers`` processes (or threads if ``threads``
+    is True) if given, see :func:`evaluate_parallel`.
+    Results are written to ``out``, a rows by cols array, if provided.
     """
     rows, cols, n_params = grid.shape
     flatten_grid = grid.reshape((rows * cols, n_params))
-    pred = np.apply_along_axis(model, 1, flatten_grid)
-    return pred.reshape(rows, cols)
+
+    if out is None:
+        out = np.empty((rows, cols))
+    elif out.shape != (rows, cols):
+        raise ValueError("Output should have shape " + str((rows, cols)))
+    flatten_out = out.reshape(rows * cols)
+
+    if _batch_function(model) is None and n_workers not in (None, 1):
+        evaluate_parallel(model, flatten_grid, n_workers=n_workers,
+                          threads=threads, out=flatten_out)
+    else:
+        for i in range(0, len(flatten_grid), chunk_size):
+            chunk = flatten_grid[i:i + chunk_size]
+            flatten_out[i:i + chunk_size] = evaluate_batch(model, chunk)
+
+    # results can't be written through a non-contiguous view
+    if not np.shares_memory(flatten_out, out):
+        out[...] = flatten_out.reshape(rows, cols)
+
+    return out
+
+
+def evaluate_batch(f, X):
+    """
+    Evaluates f for every row of X and returns an array of N values.
+
+    Emulators and other objects providing ``evaluate_batch`` are evaluated
+    with a single call. For a :class:`pints.LogPosterior` of such a
+    likelihood the prior is evaluated point by point and the likelihood as
+    a batch, only for points inside the support of the prior. Any other
+    function is called once per row.
+    """
+    X = np.asarray(X, dtype=float)
+    batch = _batch_function(f)
+    if batch is not None:
+        return batch(X)
+    return _evaluate_chunk((f, X))
+
+
+def _batch_function(f):
+    """
+    Returns a function evaluating f on a batch of inputs, or None if f
+    doesn't support batches.
+    """
+    if hasattr(f, "evaluate_batch"):
+        def batch(X):
+            values = np.asarray(f.evaluate_batch(X), dtype=float)
+            return values.reshape(len(X))
+        return batch
+
+    import pints
+
+    if isinstance(f, pints.LogPosterior) and \
+            hasattr(f.log_likelihood(), "evaluate_batch"):
+        log_prior, log_likelihood = f.log_prior(), f.log_likelihood()
+
+        def batch(X):
+            values = np.array([log_prior(x) for x in X], dtype=float)
+            inside = np.isfinite(values)
+            if np.any(inside):
+                values[inside] += np.asarray(
+                    log_likelihood.evaluate_batch(X[inside]),
+                    dtype=float).reshape(np.sum(inside))
+            return values
+        return batch
+
+    return None
+
+
+def _find_emulator(f):
+    """
+    Returns the emulator behind ``f``, which may be wrapped (e.g. in an
+    :class:`EmulatorWrapper` or a :class:`pints.LogPosterior`), or None if
+    ``f`` doesn't use an emulator. Emulators are recognised by the version
+    counter they increment whenever their predictions change.
+    """
+    while not hasattr(f, "_version"):
+        for name in ("_emu", "_emulator", "_log_likelihood"):
+            inner = getattr(f, name, None)
+            if inner is not None:
+                f = inner
+                break
+        else:
+            return None
+    return f
+
+
+def sample_design(lower, upper, n_samples, design="lhs", seed=None):
+    """
+    Draws n_samples points inside the box [lower, upper].
+
+    Arguments:
+
+    ``lower``
+        Lower bounds for each parameter.
+    ``upper``
+        Upper bounds for each parameter.
+    ``n_samples``
+        Number of points to draw.
+    ``design``
+        (Optional) "lhs" for Latin hypercube, "sobol" for a scrambled Sobol
+        sequence or "uniform" for independent uniform samples.
+    ``seed``
+        (Optional) Seed making the design reproducible.
+
+    Returns n_samples by n_parameters matrix.
+    """
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    n_parameters = len(lower)
+    rng = np.random.RandomState(seed)
+
+    if design == "uniform":
+        unit = rng.uniform(size=(n_samples, n_parameters))
+    elif design == "lhs":
+        # one point in each of n_samples strata along every dimension
+        strata = np.array([rng.permutation(n_samples)
+                           for _ in range(n_parameters)]).T
+        unit = (strata + rng.uniform(size=(n_samples, n_parameters)))
+        unit = unit / n_samples
+    elif design == "sobol":
+        from scipy.stats import qmc
+        unit = qmc.Sobol(n_parameters, scramble=True, seed=rng).random(
+            n_samples)
+    else:
+        raise ValueError("Unknown design: " + str(design))
+
+    return lower + unit * (upper - lower)
+
+
+def evaluate_parallel(f, X, n_workers=None, chunk_size=None, threads=False,
+                      out=None):
+    """
+    Evaluates f for every row of X in a pool of worker processes.
+    Rows are sent to workers in chunks to reduce communication overhead.
+    f has to be picklable, e.g. a :class:`pints.LogPDF`, unless threads
+    are used.
+
+    Arguments:
+
+    ``f``
+        Function of a single parameter vector returning a scalar.
+    ``X``
+        N by n_parameters matrix of inputs.
+    ``n_workers``
+        (Optional) Number of processes, all cores by default.
+        With ``n_workers=1`` f is evaluated serially in this process.
+    ``chunk_size``
+        (Optional) Number of rows per task, by default the work is split
+        into about 4 tasks per worker.
+    ``threads``
+        (Optional) Use a pool of threads instead of processes, e.g. for
+        functions that release the interpreter lock or can't be pickled.
+    ``out``
+        (Optional) Array of N values the results are written to.
+
+    Returns array of N values.
+    """
+    X = np.asarray(X, dtype=float)
+    if out is None:
+        out = np.empty(len(X))
+    return _map_chunks(_evaluate_chunk, (f, ), X, out, n_workers,
+                       chunk_size, threads)
+
+
+def _map_chunks(work, args, X, out, n_workers=None, chunk_size=None,
+                threads=False):
+    """
+    Splits the rows of X into chunks, writes ``work(args + (chunk, ))`` to
+    the corresponding rows of ``out`` and returns ``out``. Chunks are
+    processed in a pool of worker processes (or threads), see
+    :func:`evaluate_parallel`.
+    """
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+
+    if n_workers == 1 or len(X) <= 1:
+        out[:] = work(args + (X, ))
+        return out
+
+    if chunk_size is None:
+        chunk_size = max(1, int(np.ceil(len(X) / (4. * n_workers))))
+
+    chunks = [args + (X[i:i + chunk_size], )
+              for i in range(0, len(X), chunk_size)]
+    if threads:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(n_workers)
+    else:
+        pool = multiprocessing.Pool(n_workers)
+    try:
+        # chunks are returned in order, each is copied into the output
+        for i, values in enumerate(pool.imap(work, chunks)):
+            out[i * chunk_size:i * chunk_size + len(values)] = values
+    finally:
+        pool.close()
+        pool.join()
+
+    return out
+
+
+def _evaluate_chunk(task):
+    f, X = task
+    values = np.empty(len(X))
+    for i, x in enumerate(X):
+        values[i] = f(x)
+    return values
+
+
+def simulate_parallel(model, X, times, n_workers=None, chunk_size=None):
+    """
+    Simulates a :class:`pints.ForwardModel` for every row of X in a pool of
+    worker processes, as :func:`evaluate_parallel` does for log-likelihoods.
+
+    Arguments:
+
+    ``model``
+        Picklable forward model.
+    ``X``
+        N by n_parameters matrix of parameters.
+    ``times``
+        Time points to simulate.
+    ``n_workers``
+        (Optional) Number of processes, all cores by default.
+        With ``n_workers=1`` the model is simulated in this process.
+    ``chunk_size``
+        (Optional) Number of rows per task.
+
+    Returns N by n_times by n_outputs array.
+    """
+    X = np.asarray(X, dtype=float)
+    times = np.asarray(times, dtype=float)
+    out = np.empty((len(X), len(times), model.n_outputs()))
+    return _map_chunks(_simulate_chunk, (model, times), X, out, n_workers,
+                       chunk_size)
+
+
+def _simulate_chunk(task):
+    model, times, X = task
+    values = np.empty((len(X), len(times), model.n_outputs()))
+    for i, x in enumerate(X):
+        values[i] = np.asarray(model.simulate(x, times)).reshape(
+            values.shape[1:])
+    return values
+
+
+def check_gradient(f, x, step=1e-6):
+    """
+    Compares the gradient returned by ``f.evaluateS1(x)`` with central
+    finite differences of ``f`` around ``x``, using a relative step.
+
+    Returns the maximum absolute difference between the two, relative to
+    the largest absolute gradient component (or absolute if that is 0).
+    """
+    x = np.asarray(x, dtype=float)
+    _, gradient = f.evaluateS1(x)
+    gradient = np.asarray(gradient, dtype=float)
+
+    numerical = np.zeros(len(x))
+    for i in range(len(x)):
+        h = step * max(1., abs(x[i]))
+        x_up, x_down = x.copy(), x.copy()
+        x_up[i] += h
+        x_down[i] -= h
+        numerical[i] = (f(x_up) - f(x_down)) / (2 * h)
+
+    error = np.max(np.abs(gradient - numerical))
+    scale = np.max(np.abs(numerical))
+    return error / scale if scale > 0 else error
 
 
 # Functions to deal with composite kernels
@@ -91,6 +364,7 @@ def is_prod_kernel(kernel):
     """
     True when a given kernel is a GPy Prod kernel
     """
+    from GPy import kern
     return type(kernel) == kern.src.prod.Prod
 
 
@@ -98,6 +372,7 @@ def is_add_kernel(kernel):
     """
     True when a given kernel is a GPy Add kernel
     """
+    from GPy import kern
     return type(kernel) == kern.src.add.Add
 
 
@@ -127,6 +402,51 @@ def kernel_to_string(kernel, ident=0, decimal_places=4):
     return " " * ident + s
 
 
+def canonical_kernel_string(kernel):
+    """
+    Returns the structure of a (composite) GPy kernel as a single line
+    string without hyperparameter values, e.g. "(+ Linear[0] (* RBF[0,1]
+    RBF[2]))". Nested sums and products are flattened and their operands
+    sorted, so equivalent structures give the same string.
+    """
+    if is_prod_kernel(kernel) or is_add_kernel(kernel):
+        op = "*" if is_prod_kernel(kernel) else "+"
+        operands = []
+        for sub_kernel in kernel.parameters:
+            sub_string = canonical_kernel_string(sub_kernel)
+            if sub_string.startswith("(" + op + " "):
+                # same operation is associative, merge operands
+                operands.extend(_split_operands(sub_string))
+            else:
+                operands.append(sub_string)
+        return "(" + op + " " + " ".join(sorted(operands)) + ")"
+
+    name = str(type(kernel)).split(".")[-1]
+    name = name[:-2]
+    if getattr(kernel, "ARD", False):
+        name += "ARD"
+    dims = ",".join(str(d) for d in kernel._all_dims_active)
+    return name + "[" + dims + "]"
+
+
+def _split_operands(s):
+    """
+    Splits "(op a b ...)" into top level operands.
+    """
+    operands = []
+    depth = 0
+    current = ""
+    for c in s[3:-1]:
+        if c == " " and depth == 0:
+            operands.append(current)
+            current = ""
+            continue
+        depth += (c == "(") - (c == ")")
+        current += c
+    operands.append(current)
+    return operands
+
+
 def get_total_variance(kernel):
     ans = 0
     if is_prod_kernel(kernel) or is_add_kernel(kernel):
@@ -161,12 +481,93 @@ def has_high_variance(kernel, threshold=10):
     return variance > threshold
 
 
+# Inducing point selection for sparse GPs
+def select_inducing_points(X, n_inducing, method="kmeans", kernel=None,
+                           seed=None):
+    """
+    Chooses ``n_inducing`` inducing inputs for a sparse GP trained on ``X``.
+
+    Arguments:
+
+    ``X``
+        N by n_parameters matrix of training inputs.
+    ``n_inducing``
+        Number of inducing points. If not smaller than N, X is returned.
+    ``method``
+        (Optional) "kmeans" for k-means cluster centres, "variance" for
+        greedy selection of the training points with the largest remaining
+        prior variance, "random" for a random subset of training points.
+    ``kernel``
+        (Optional) GPy kernel used by "variance" method, RBF by default.
+    ``seed``
+        (Optional) Seed for the random number generator.
+
+    Returns n_inducing by n_parameters matrix.
+    """
+    X = np.asarray(X, dtype=float)
+    n_points, n_parameters = X.shape
+    if n_inducing >= n_points:
+        return X.copy()
+
+    if method == "kmeans":
+        return kmeans_inducing_points(X, n_inducing, seed=seed)
+    elif method == "variance":
+        return greedy_variance_inducing_points(X, n_inducing, kernel=kernel)
+    elif method == "random":
+        rng = np.random.RandomState(seed)
+        return X[rng.choice(n_points, n_inducing, replace=False)]
+    else:
+        raise ValueError("Unknown inducing point selection method: " +
+                         str(method))
+
+
+def kmeans_inducing_points(X, n_inducing, seed=None, iterations=20):
+    """
+    Returns k-means cluster centres of X as inducing points.
+    Cost is linear in the number of training points.
+    """
+    from scipy.cluster.vq import kmeans2
+
+    centres, _ = kmeans2(X, n_inducing, iter=iterations, minit="++",
+                         seed=np.random.RandomState(seed))
+    return centres
+
+
+def greedy_variance_inducing_points(X, n_inducing, kernel=None):
+    """
+    Greedily picks training points with the largest posterior variance given
+    already picked points (a pivoted Cholesky decomposition of the kernel
+    matrix). Costs O(N * n_inducing^2) and never forms the full N by N matrix.
+    """
+    if kernel is None:
+        from GPy import kern
+        kernel = kern.RBF(X.shape[1])
+
+    n_points = len(X)
+    L = np.zeros((n_inducing, n_points))
+    residual = np.array(kernel.Kdiag(X), dtype=float)
+    chosen = []
+    for m in range(n_inducing):
+        i = int(np.argmax(residual))
+        if residual[i] <= 1e-12:
+            break
+        chosen.append(i)
+
+        k_i = kernel.K(X, X[i:i + 1]).flatten()
+        L[m] = (k_i - np.dot(L[:m, i], L[:m])) / np.sqrt(residual[i])
+        residual = residual - L[m] ** 2
+        residual[chosen] = 0
+
+    return X[chosen]
+
+
 def simulate(
     model,
     parameters=None,
     times=None,
     noise_range_percent=0.05,
-    n_splits=None
+    n_splits=None,
+    random_state=None
 ):
     """
     Simulates model for specified time interval with specified noise.
@@ -174,6 +575,8 @@ def simulate(
     Pass noise_range_percent=None if no noise wanted
     Returns values, times, noise_stds
     If n_splits is provided divide time interval into n_splits uniform parts.
+    random_state can be a seed or np.random.RandomState to make noise
+    reproducible.
     """
 
     if parameters is None:
@@ -196,7 +599,13 @@ def simulate(
         noise_stds = np.abs(values.max(axis=0) - values.min(axis=0)) * noise_range_percent
 
         # final values
-        values = values + np.random.normal(0, noise_stds, values.shape)
+        if random_state is None:
+            noise = np.random.normal(0, noise_stds, values.shape)
+        else:
+            if not isinstance(random_state, np.random.RandomState):
+                random_state = np.random.RandomState(random_state)
+            noise = random_state.normal(0, noise_stds, values.shape)
+        values = values + noise
 
         return values, times, noise_stds
 